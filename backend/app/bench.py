@@ -0,0 +1,402 @@
+"""Offline benchmark suite for the training, loading and inference hot paths.
+
+Run from ``backend/``:
+
+    python -m app.bench --output bench_output.json
+    python -m app.bench --quick --compare bench_output.json
+    python -m app.bench --startup-only --compare bench_output.json --max-regression 1.25
+
+Training and inference run against a synthetic KOI-shaped catalogue written to
+a temporary directory, so the suite needs no network access and never touches
+``data/raw``, ``model/outputs`` or ``db.sqlite3``. The artifact loading section
+only reads the ``.joblib`` files already present in ``model/outputs``.
+
+The startup section imports ``app.main`` in fresh interpreters and records the
+import time and peak RSS of a normal and an ``INFERENCE_ONLY=1`` server. The
+run fails if the inference-only server imports any of ``TRAINING_MODULES``,
+or, with ``--max-regression``, if any median got slower than that ratio.
+"""
+import os
+import io
+import sys
+import json
+import time
+import shutil
+import joblib
+import argparse
+import platform
+import tempfile
+import statistics
+import subprocess
+import contextlib
+import numpy as np
+import pandas as pd
+from .model import kepler
+from .model import predict as predict_module
+from .model.result_cache import PREDICTION_CACHE
+from . import service
+
+# Rows of the synthetic catalogue (about the size of the real KOI table)
+BENCH_DATASET_ROWS = int(os.environ.get("BENCH_DATASET_ROWS", 9564))
+BENCH_THREADS = int(os.environ.get("BENCH_THREADS", 4))
+INFERENCE_SIZES = (1000, 10000, 100000)
+QUICK_INFERENCE_SIZES = (1000, 10000)
+
+# Fixed hyperparameters so training times are comparable between commits
+TRAIN_PARAMS = {
+    "light_gbm": dict(
+        random_state=42, learning_rate=0.05, n_estimators=300, num_leaves=40,
+        feature_fraction=0.8, lambda_l1=0.1, lambda_l2=0.1, verbose=-1,
+    ),
+    "xgboost": dict(
+        objective="binary:logistic", eval_metric="auc", n_estimators=300, learning_rate=0.05,
+        max_depth=8, subsample=0.8, colsample_bytree=0.8, random_state=42,
+    ),
+    "random_forest": dict(
+        n_estimators=150, max_depth=15, min_samples_leaf=5, random_state=42,
+    ),
+}
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# A serving-only replica must start without any of these
+TRAINING_MODULES = ("matplotlib", "lightgbm", "xgboost", "sklearn", "scipy", "app.model.kepler")
+
+STARTUP_MODES = {
+    "full": {"INFERENCE_ONLY": "0"},
+    "inference_only": {"INFERENCE_ONLY": "1"},
+}
+
+STARTUP_PROBE = """
+import sys, json, time, resource
+start = time.perf_counter()
+import app.main
+seconds = time.perf_counter() - start
+try:
+    # Peak RSS of this image only; ru_maxrss keeps the forking parent's peak across exec
+    with open("/proc/self/status") as f:
+        rss_mb = next(int(line.split()[1]) for line in f if line.startswith("VmHWM:")) / 1024
+except OSError:
+    # ru_maxrss is in bytes on macOS
+    rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 * 1024)
+modules = sorted(name for name in %r if name in sys.modules)
+print(json.dumps({"seconds": seconds, "rss_mb": rss_mb, "modules": modules}))
+""" % (TRAINING_MODULES,)
+
+# KOI exports start with a commented header that load_kepler_data skips
+KOI_HEADER = ["# Synthetic KOI table generated by app.bench"] + ["#"] * (kepler.KOI_SKIPROWS - 1)
+
+def make_koi_frame(n_rows: int, seed: int = 0) -> pd.DataFrame:
+    """Synthetic catalogue with the KOI columns, value ranges and missing values."""
+    rng = np.random.default_rng(seed)
+    disposition = rng.choice(["CONFIRMED", "CANDIDATE", "FALSE POSITIVE"], size=n_rows, p=[0.29, 0.21, 0.50])
+    is_fp = disposition == "FALSE POSITIVE"
+
+    srad = rng.lognormal(0.0, 0.4, n_rows)
+    prad = np.where(is_fp, rng.lognormal(np.log(12), 1.5, n_rows), rng.lognormal(np.log(2.2), 0.6, n_rows))
+    teq = rng.lognormal(np.log(880), 0.4, n_rows)
+
+    df = pd.DataFrame({
+        "kepid": rng.integers(757000, 13000000, n_rows),
+        "kepoi_name": [f"K{i:05d}.01" for i in range(n_rows)],
+        "koi_disposition": disposition,
+        "koi_fpflag_nt": np.where(is_fp, rng.random(n_rows) < 0.6, 0).astype(int),
+        "koi_fpflag_ss": np.where(is_fp, rng.random(n_rows) < 0.5, 0).astype(int),
+        "koi_period": rng.lognormal(np.log(10), 1.3, n_rows),
+        "koi_time0bk": 120 + rng.exponential(50, n_rows),
+        "koi_impact": np.where(is_fp, rng.uniform(0, 1.5, n_rows), rng.beta(2, 2, n_rows)),
+        "koi_duration": rng.lognormal(np.log(3.8), 0.6, n_rows),
+        # Transit depth in ppm ~ (Rp / R*)^2 with Rp in Earth radii
+        "koi_depth": 84 * prad ** 2 / srad ** 2 * rng.lognormal(0, 0.3, n_rows),
+        "koi_prad": prad,
+        "koi_teq": teq,
+        "koi_insol": (teq / 255) ** 4 * rng.lognormal(0, 0.2, n_rows),
+        "koi_model_snr": np.where(is_fp, rng.lognormal(np.log(50), 1.5, n_rows), rng.lognormal(np.log(20), 1.0, n_rows)),
+        "koi_steff": np.clip(rng.normal(5700, 700, n_rows), 2600, 15000),
+        "koi_srad": srad,
+    })
+
+    # About 3% of each feature is missing, like in the real export
+    for column in kepler.KOI_FEATURES:
+        df.loc[rng.random(n_rows) < 0.03, column] = np.nan
+
+    return df
+
+def write_koi_csv(path: str, df: pd.DataFrame):
+    with open(path, "w") as f:
+        f.write("\n".join(KOI_HEADER) + "\n")
+        df.to_csv(f, index=False)
+
+def features_frame(n_rows: int, seed: int) -> pd.DataFrame:
+    """Inference input: KOI_FEATURES columns only, no missing values."""
+    df = make_koi_frame(n_rows, seed)[kepler.KOI_FEATURES]
+    return df.fillna(df.median())
+
+def measure(fn, repeat: int, setup=None) -> dict:
+    """Time ``fn`` ``repeat`` times; ``setup`` runs untimed before each call."""
+    timings = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+
+    return summarize(timings)
+
+def summarize(values) -> dict:
+    return {
+        "n": len(values),
+        "min": min(values),
+        "median": statistics.median(values),
+        "mean": statistics.fmean(values),
+        "max": max(values),
+    }
+
+def _quiet(fn):
+    """Run ``fn`` with its prints discarded (the training and predict paths are chatty)."""
+    def wrapper():
+        with contextlib.redirect_stdout(io.StringIO()):
+            return fn()
+    return wrapper
+
+def _clear_model_caches():
+    predict_module.MODEL_CACHE.clear()
+    PREDICTION_CACHE.clear()
+
+def bench_dataset(results: dict, repeat: int):
+    def drop_cache():
+        shutil.rmtree(kepler.DATASET_CACHE_PATH, ignore_errors=True)
+        kepler._file_hashes.clear()
+
+    results["dataset/parse_csv"] = measure(lambda: kepler.load_kepler_data(use_cache=False), repeat)
+    results["dataset/build_cache"] = measure(kepler.load_kepler_data, repeat, setup=drop_cache)
+    results["dataset/load_cached"] = measure(kepler.load_kepler_data, repeat)
+
+def bench_training(results: dict, repeat: int, threads: int) -> dict:
+    """Train each model type with ``TRAIN_PARAMS``; returns the artifact path per type."""
+    artifacts = {}
+    for model_type, params in TRAIN_PARAMS.items():
+        run_params = {**params, "n_jobs": threads}
+        trained = []
+
+        def train():
+            trained.append(kepler.train_and_evaluate_model(model_type, run_params))
+
+        stats = measure(_quiet(train), repeat)
+        filename, accuracy, roc_auc, pr_auc, _ = trained[-1]
+        results[f"training/{model_type}"] = {**stats, "accuracy": accuracy, "roc_auc": roc_auc, "pr_auc": pr_auc}
+        artifacts[model_type] = os.path.join(kepler.OUTPUTS_PATH, filename)
+
+    return artifacts
+
+def bench_loading(results: dict, repeat: int, artifacts: dict):
+    paths = {}
+    if os.path.isdir(service.MODELOS):
+        for name in sorted(os.listdir(service.MODELOS)):
+            if name.endswith(".joblib") and not name.startswith("."):
+                paths[f"outputs/{name}"] = os.path.join(service.MODELOS, name)
+    for model_type, path in artifacts.items():
+        paths[f"synthetic/{model_type}"] = path
+
+    for label, path in paths.items():
+        results[f"loading/joblib/{label}"] = {
+            **measure(lambda: joblib.load(path), repeat),
+            "bytes": os.path.getsize(path),
+        }
+
+        compiled = predict_module.compiled_path(path)
+        if os.path.exists(compiled):
+            results[f"loading/compiled/{label}"] = {
+                **measure(lambda: predict_module.CompiledEnsemble.load(compiled), repeat),
+                "bytes": os.path.getsize(compiled),
+            }
+
+        directory = predict_module.artifact_path(path)
+        if os.path.isdir(directory):
+            results[f"loading/artifact_mmap/{label}"] = {
+                **measure(lambda: predict_module.load_artifact(directory), repeat),
+                "bytes": sum(entry.stat().st_size for entry in os.scandir(directory)),
+            }
+
+def bench_inference(results: dict, repeat: int, artifacts: dict, sizes, seed: int):
+    from fastapi.testclient import TestClient
+    from .main import app
+
+    # Without the ``with`` block the lifespan (and its SQLite setup) never runs
+    client = TestClient(app)
+    candidate = features_frame(100, seed).iloc[0].to_dict()
+    frames = {n_rows: features_frame(n_rows, seed + n_rows) for n_rows in sizes}
+    uploads = {n_rows: df.to_csv(index=False).encode() for n_rows, df in frames.items()}
+
+    for model_type, path in artifacts.items():
+        single = _quiet(lambda: predict_module.predict_candidate(path, dict(candidate)))
+        results[f"inference/predict_candidate/{model_type}/cold"] = measure(single, repeat, setup=_clear_model_caches)
+        results[f"inference/predict_candidate/{model_type}/warm"] = measure(single, repeat)
+
+        for n_rows, df in frames.items():
+            stats = measure(lambda: predict_module.predict_batch(path, df), repeat)
+            results[f"inference/predict_batch/{model_type}/{n_rows}"] = {
+                **stats, "rows_per_second": n_rows / stats["median"],
+            }
+
+        service.BASE_ML_MODEL = path
+        for n_rows, body in uploads.items():
+            def post():
+                response = client.post("/api/predict_csv", files={"file": ("bench.csv", body, "text/csv")})
+                response.raise_for_status()
+
+            # The prediction cache is cleared so every request really runs the model
+            stats = measure(post, repeat, setup=PREDICTION_CACHE.clear)
+            results[f"inference/predict_csv_route/{model_type}/{n_rows}"] = {
+                **stats, "rows_per_second": n_rows / stats["median"],
+            }
+
+def _probe_startup(env: dict) -> dict:
+    completed = subprocess.run(
+        [sys.executable, "-c", STARTUP_PROBE], env={**os.environ, **env}, cwd=BACKEND_DIR,
+        capture_output=True, text=True, check=True,
+    )
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+def bench_startup(results: dict, repeat: int):
+    """Cold import of ``app.main``, one fresh interpreter per run."""
+    for mode, env in STARTUP_MODES.items():
+        probes = [_probe_startup(env) for _ in range(repeat)]
+        results[f"startup/{mode}/import"] = {
+            **summarize([probe["seconds"] for probe in probes]),
+            "training_modules": sorted({name for probe in probes for name in probe["modules"]}),
+        }
+        results[f"startup/{mode}/rss_mb"] = summarize([probe["rss_mb"] for probe in probes])
+
+def startup_violations(results: dict) -> list:
+    """Training modules imported by the inference-only server."""
+    return results.get("startup/inference_only/import", {}).get("training_modules", [])
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(__file__),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def _versions() -> dict:
+    import sklearn
+    import lightgbm
+    import xgboost
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "scikit-learn": sklearn.__version__,
+        "lightgbm": lightgbm.__version__,
+        "xgboost": xgboost.__version__,
+    }
+
+def run(args) -> dict:
+    sizes = QUICK_INFERENCE_SIZES if args.quick else INFERENCE_SIZES
+    results = {}
+
+    bench_startup(results, args.repeat)
+    if args.startup_only:
+        return _report(args, results, sizes)
+
+    workdir = tempfile.mkdtemp(prefix="exo-bench-")
+    saved = (kepler.DATA_PATH, kepler.OUTPUTS_PATH, kepler.DATASET_CACHE_PATH, service.BASE_ML_MODEL)
+    try:
+        kepler.DATA_PATH = os.path.join(workdir, "raw")
+        kepler.OUTPUTS_PATH = os.path.join(workdir, "outputs")
+        kepler.DATASET_CACHE_PATH = os.path.join(workdir, "cache")
+        os.makedirs(kepler.DATA_PATH)
+        os.makedirs(kepler.OUTPUTS_PATH)
+        write_koi_csv(os.path.join(kepler.DATA_PATH, "koi.csv"), make_koi_frame(args.rows, args.seed))
+
+        bench_dataset(results, args.repeat)
+        artifacts = bench_training(results, args.train_repeat, args.threads)
+        bench_loading(results, args.repeat, artifacts)
+        bench_inference(results, args.repeat, artifacts, sizes, args.seed)
+    finally:
+        kepler.DATA_PATH, kepler.OUTPUTS_PATH, kepler.DATASET_CACHE_PATH, service.BASE_ML_MODEL = saved
+        _clear_model_caches()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return _report(args, results, sizes)
+
+def _report(args, results: dict, sizes) -> dict:
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "versions": _versions(),
+            "config": {
+                "rows": args.rows, "repeat": args.repeat, "train_repeat": args.train_repeat,
+                "threads": args.threads, "seed": args.seed, "inference_sizes": list(sizes),
+            },
+        },
+        "results": results,
+    }
+
+def compare(old: dict, new: dict, max_regression: float = None) -> list:
+    """Print the median of every benchmark present in both reports.
+
+    Returns the names whose ratio exceeds ``max_regression``.
+    """
+    regressions = []
+    print(f"{'benchmark':<58} {'before':>10} {'after':>10} {'ratio':>7}")
+    for name, stats in new["results"].items():
+        before = old.get("results", {}).get(name)
+        if before is None:
+            continue
+        ratio = stats["median"] / before["median"] if before["median"] else float("inf")
+        flag = ""
+        if max_regression is not None and ratio > max_regression:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:<58} {before['median']:>10.4f} {stats['median']:>10.4f} {ratio:>6.2f}x{flag}")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark training, loading and inference.")
+    parser.add_argument("--output", default="bench_output.json", help="JSON report path ('-' for stdout)")
+    parser.add_argument("--compare", help="previous JSON report to compare medians against")
+    parser.add_argument("--rows", type=int, default=BENCH_DATASET_ROWS, help="rows of the synthetic catalogue")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per loading/inference benchmark")
+    parser.add_argument("--train-repeat", type=int, default=1, help="runs per training benchmark")
+    parser.add_argument("--threads", type=int, default=BENCH_THREADS, help="n_jobs for training")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--quick", action="store_true", help=f"skip the {INFERENCE_SIZES[-1]}-row inference runs")
+    parser.add_argument("--startup-only", action="store_true", help="only measure server startup (no training)")
+    parser.add_argument("--max-regression", type=float, help="exit 1 if a median is this many times slower than --compare")
+    args = parser.parse_args(argv)
+
+    report = run(args)
+
+    if args.output == "-":
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+
+    failed = False
+    violations = startup_violations(report["results"])
+    if violations:
+        print(f"Inference-only startup imported training modules: {', '.join(violations)}")
+        failed = True
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(json.load(f), report, args.max_regression)
+        if regressions:
+            print(f"{len(regressions)} benchmark(s) regressed beyond {args.max_regression}x")
+            failed = True
+
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,120 @@
+"""Process-wide CPU budget shared by training and inference.
+
+The cores are split into an inference budget (native predict calls in the API
+process) and a training budget (fits in the job and sweep worker processes):
+
+* Training workers share a counter of fits in progress across both pools. Each
+  fit starts with ``TRAINING_THREADS // running`` threads, passed as ``n_jobs``
+  to the LightGBM, XGBoost and scikit-learn constructors.
+* Each predict call gets ``INFERENCE_THREADS // concurrent calls`` threads,
+  fewer for small batches, so parallel requests do not oversubscribe.
+* When both are busy, priority goes inference > training jobs > sweeps. Worker
+  processes raise their niceness so the OS scheduler favours the API process.
+"""
+import os
+import threading
+import weakref
+import multiprocessing
+from contextlib import contextmanager
+
+CPU_BUDGET = int(os.environ.get("CPU_BUDGET", os.cpu_count() or 1))
+INFERENCE_THREADS = int(os.environ.get("INFERENCE_THREADS", max(1, CPU_BUDGET // 2)))
+TRAINING_THREADS = int(os.environ.get("TRAINING_THREADS", max(1, CPU_BUDGET - INFERENCE_THREADS)))
+
+# Niceness added to worker processes; higher runs later when cores are contended
+TRAINING_NICE = int(os.environ.get("TRAINING_NICE", 5))
+SWEEP_NICE = int(os.environ.get("SWEEP_NICE", 10))
+
+# A predict call only gets another thread for every this many rows
+ROWS_PER_THREAD = int(os.environ.get("ROWS_PER_THREAD", 2048))
+
+_lock = threading.Lock()
+_inference_active = 0
+_xgboost_configured = weakref.WeakSet()
+
+# Shared with the worker processes through their pool initializer
+_training_running = None
+
+def training_counter():
+    """Counter of fits in progress, created in the API process and inherited by the pools."""
+    global _training_running
+    with _lock:
+        if _training_running is None:
+            _training_running = multiprocessing.get_context("spawn").Value("i", 0)
+        return _training_running
+
+def init_training_worker(counter, nice: int):
+    """Pool initializer for job and sweep workers."""
+    global _training_running
+    _training_running = counter
+    if nice and hasattr(os, "nice"):
+        try:
+            os.nice(nice)
+        except OSError:
+            pass
+
+@contextmanager
+def training_slot():
+    """Reserve a share of the training budget for one fit; yields its thread count.
+
+    Outside a governed worker (CLI, synchronous create_model) the fit gets the
+    whole training budget.
+    """
+    counter = _training_running
+    if counter is None:
+        yield TRAINING_THREADS
+        return
+
+    with counter.get_lock():
+        counter.value += 1
+        running = counter.value
+    try:
+        yield max(1, TRAINING_THREADS // running)
+    finally:
+        with counter.get_lock():
+            counter.value -= 1
+
+def training_params(params: dict, threads: int) -> dict:
+    """Set ``n_jobs`` to the training share unless the caller pinned a positive value."""
+    n_jobs = params.get("n_jobs")
+    if n_jobs is None or n_jobs < 0:
+        return {**params, "n_jobs": threads}
+    return params
+
+def _set_inference_threads(model, threads: int):
+    name = type(model).__name__
+    if name in ("LGBMClassifier", "RandomForestClassifier"):
+        # Both read n_jobs on every predict call
+        model.n_jobs = threads
+    elif name == "XGBClassifier" and model not in _xgboost_configured:
+        # Changing a booster parameter while another thread predicts is unsafe,
+        # so XGBoost models get the whole inference budget once, when first used
+        model.n_jobs = INFERENCE_THREADS
+        model.get_booster().set_param({"nthread": INFERENCE_THREADS})
+        _xgboost_configured.add(model)
+
+@contextmanager
+def inference(model, n_rows: int):
+    """Wrap one native predict call; yields the thread count it was given."""
+    global _inference_active
+    with _lock:
+        _inference_active += 1
+        active = _inference_active
+
+    threads = max(1, min(INFERENCE_THREADS // active, -(-n_rows // ROWS_PER_THREAD)))
+    _set_inference_threads(model, threads)
+    try:
+        yield threads
+    finally:
+        with _lock:
+            _inference_active -= 1
+
+def stats() -> dict:
+    counter = _training_running
+    return {
+        "cpu_budget": CPU_BUDGET,
+        "inference_threads": INFERENCE_THREADS,
+        "training_threads": TRAINING_THREADS,
+        "inference_active": _inference_active,
+        "training_running": counter.value if counter is not None else 0,
+    }
@@ -0,0 +1,327 @@
+import os
+import json
+import time
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import List, Optional, Union
+import numpy as np
+from .schemas import LightGBMParams, XGBoostParams, RandomForestParams, ContinueTrainingRequest
+from .model.features import to_matrix
+from . import service, db, metrics, governor
+
+# Maximum number of models trained at the same time. Each job runs in its own
+# process so a long fit never blocks the threads serving predictions.
+TRAINING_MAX_WORKERS = int(os.environ.get("TRAINING_MAX_WORKERS", 1))
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+
+# Per-iteration progress is buffered in the worker and written at most this often
+PROGRESS_FLUSH_SECONDS = float(os.environ.get("PROGRESS_FLUSH_SECONDS", 0.5))
+
+_executor = None
+_executor_lock = threading.Lock()
+
+# Serializes the duplicate check with the insert of the job it would have found
+_submit_lock = threading.Lock()
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=TRAINING_MAX_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=governor.init_training_worker,
+                initargs=(governor.training_counter(), governor.TRAINING_NICE),
+            )
+        return _executor
+
+def shutdown():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+
+def init_jobs_table():
+    """Create the training_job table and fail jobs left over by a previous run."""
+    with db.transaction() as cursor:
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS training_job (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                status TEXT NOT NULL,
+                model_type TEXT NOT NULL,
+                params TEXT NOT NULL,
+                fingerprint TEXT,
+                model_id INTEGER,
+                error TEXT,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL,
+                FOREIGN KEY (model_id) REFERENCES model(id)
+            )
+        """)
+        columns = {row[1] for row in cursor.execute("PRAGMA table_info(training_job)")}
+        if "fingerprint" not in columns:
+            cursor.execute("ALTER TABLE training_job ADD COLUMN fingerprint TEXT")
+        cursor.execute("CREATE INDEX IF NOT EXISTS training_job_fingerprint ON training_job (fingerprint, status)")
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS training_progress (
+                job_id INTEGER NOT NULL,
+                iteration INTEGER NOT NULL,
+                elapsed REAL NOT NULL,
+                auc REAL,
+                logloss REAL,
+                best_iteration INTEGER,
+                stopped TEXT,
+                PRIMARY KEY (job_id, iteration),
+                FOREIGN KEY (job_id) REFERENCES training_job(id)
+            )
+        """)
+        # Nothing survives a restart of the process pool
+        cursor.execute("""
+            UPDATE training_job SET status = ?, error = ?, finished_at = ?
+            WHERE status IN (?, ?)
+        """, (JOB_FAILED, "Interrupted by server restart", time.time(), JOB_QUEUED, JOB_RUNNING))
+
+def _update_job(job_id: int, **fields):
+    columns = ", ".join(f"{name} = ?" for name in fields)
+    with db.transaction() as cursor:
+        cursor.execute(f"UPDATE training_job SET {columns} WHERE id = ?", (*fields.values(), job_id))
+
+class _ProgressWriter:
+    """Collects the monitor's per-iteration rows and stores them in batches."""
+
+    def __init__(self, job_id: int):
+        self.job_id = job_id
+        self.rows = []
+        self.last_flush = time.monotonic()
+
+    def __call__(self, row: dict):
+        self.rows.append(row)
+        if time.monotonic() - self.last_flush >= PROGRESS_FLUSH_SECONDS:
+            self.flush()
+
+    def flush(self):
+        self.last_flush = time.monotonic()
+        if not self.rows:
+            return
+        with db.transaction() as cursor:
+            cursor.executemany("""
+                INSERT OR REPLACE INTO training_progress
+                    (job_id, iteration, elapsed, auc, logloss, best_iteration, stopped)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, [
+                (self.job_id, row["iteration"], row["elapsed"], row["auc"], row["logloss"],
+                 row["best_iteration"], row["stopped"])
+                for row in self.rows
+            ])
+        self.rows = []
+
+def _run_training_job(job_id: int, model_type: str, params: dict):
+    """Runs inside a worker process."""
+    # Imported here so that serving processes never load the training stack
+    from .model.kepler import train_and_evaluate_model
+
+    _update_job(job_id, status=JOB_RUNNING, started_at=time.time())
+    progress = _ProgressWriter(job_id)
+    try:
+        # Phase timings are sent back with the result; this process is never scraped
+        with metrics.capture_training_phases() as phases:
+            result = train_and_evaluate_model(model_type=model_type, params=params, on_iteration=progress)
+    finally:
+        progress.flush()
+    return result, phases
+
+def _on_job_done(job_id: int, data, fingerprint: str, future):
+    try:
+        (name, accuracy, roc_auc, pr_auc, cv), phases = future.result()
+        metrics.record_training_phases(phases)
+        model_id = service.register_model(data, name, accuracy, roc_auc, pr_auc, fingerprint, cv=cv)
+    except Exception as e:
+        _update_job(job_id, status=JOB_FAILED, error=str(e) or type(e).__name__, finished_at=time.time())
+        return
+
+    _update_job(job_id, status=JOB_SUCCEEDED, model_id=model_id, error=None, finished_at=time.time())
+
+def submit_training_job(
+    data: Union[LightGBMParams, XGBoostParams, RandomForestParams],
+    fingerprint: Optional[str] = None,
+) -> int:
+    """Queue a model for training and return the job id immediately."""
+    params = data.model_dump()
+    if fingerprint is None:
+        fingerprint = service.training_fingerprint(data)
+
+    with db.transaction() as cursor:
+        cursor.execute("""
+            INSERT INTO training_job (status, model_type, params, fingerprint, created_at)
+            VALUES (?, ?, ?, ?, ?)
+        """, (JOB_QUEUED, data.model_type, json.dumps(params), fingerprint, time.time()))
+        job_id = cursor.lastrowid
+
+    future = _get_executor().submit(_run_training_job, job_id, data.model_type, params)
+    future.add_done_callback(partial(_on_job_done, job_id, data, fingerprint))
+
+    return job_id
+
+def find_active_job(fingerprint: str) -> Optional[int]:
+    """Oldest queued or running job with this fingerprint."""
+    row = db.get_connection().execute("""
+        SELECT id FROM training_job
+        WHERE fingerprint = ? AND status IN (?, ?)
+        ORDER BY id LIMIT 1
+    """, (fingerprint, JOB_QUEUED, JOB_RUNNING)).fetchone()
+
+    return row[0] if row else None
+
+def submit_or_reuse(data: Union[LightGBMParams, XGBoostParams, RandomForestParams], force: bool = False) -> dict:
+    """Queue a training job unless the same model is already trained or being trained.
+
+    Returns ``{"model_id": ...}`` for an existing model, ``{"job_id": ...}`` for
+    the job that will produce it, and ``deduplicated`` telling whether anything
+    was reused. ``force`` always queues a new job.
+    """
+    fingerprint = service.training_fingerprint(data)
+
+    with _submit_lock:
+        if not force:
+            model_id = service.find_model_by_fingerprint(fingerprint)
+            if model_id is not None:
+                return {"model_id": model_id, "deduplicated": True}
+
+            job_id = find_active_job(fingerprint)
+            if job_id is not None:
+                return {"job_id": job_id, "deduplicated": True}
+
+        return {"job_id": submit_training_job(data, fingerprint), "deduplicated": False}
+
+def _run_continue_job(job_id: int, parent_path: str, model_type: str, n_estimators: int,
+                      X_delta, y_delta, learning_rate: Optional[float]):
+    """Runs inside a worker process."""
+    from .model.kepler import continue_training
+
+    _update_job(job_id, status=JOB_RUNNING, started_at=time.time())
+    with metrics.capture_training_phases() as phases:
+        result = continue_training(parent_path, model_type, n_estimators, X_delta, y_delta, learning_rate)
+    return result, phases
+
+def _on_continue_done(job_id: int, data, fingerprint: str, parent_id: int, future):
+    try:
+        (name, accuracy, roc_auc, pr_auc, total_estimators), phases = future.result()
+        metrics.record_training_phases(phases)
+        # The new version is registered with the trees it actually has
+        data = data.model_copy(update={"n_estimators": total_estimators})
+        model_id = service.register_model(data, name, accuracy, roc_auc, pr_auc, fingerprint, parent_id)
+    except Exception as e:
+        _update_job(job_id, status=JOB_FAILED, error=str(e) or type(e).__name__, finished_at=time.time())
+        return
+
+    _update_job(job_id, status=JOB_SUCCEEDED, model_id=model_id, error=None, finished_at=time.time())
+
+def continue_or_reuse(parent_id: int, parent_path: str, req: ContinueTrainingRequest, force: bool = False) -> dict:
+    """Queue a job that adds trees to a registered model; same contract as ``submit_or_reuse``.
+
+    The result is registered as a new model whose ``parent_id`` is ``parent_id``.
+    """
+    # A cross-validated parent already fit on the test split and its metrics are
+    # fold means, so the continuation's test-split metrics could not be compared
+    if service.is_cross_validated(parent_id):
+        raise ValueError("No se puede continuar un modelo entrenado con cv_folds: sus métricas son "
+                         "medias de la validación cruzada y ya entrenó con las filas de prueba.")
+
+    # Only the hyperparameters carry over; the continuation never uses early
+    # stopping, a time budget or folds
+    data = service.get_model_params(parent_id)
+    data = type(data)(**data.model_dump(include=set(service.PARAMS_COLUMNS[data.model_type][2])))
+    if req.learning_rate is not None:
+        if data.model_type == "random_forest":
+            raise ValueError("learning_rate solo aplica a modelos boosted.")
+        data = data.model_copy(update={"learning_rate": req.learning_rate})
+
+    candidates = [candidate.model_dump() for candidate in req.candidates]
+    X_delta = to_matrix(candidates)
+    # NaN is a missing value and gets imputed like the dataset; infinities are not
+    if np.isinf(X_delta).any():
+        raise ValueError("Los candidatos no pueden tener valores infinitos.")
+    y_delta = np.array([c["koi_disposition"] in ("CONFIRMED", "CANDIDATE") for c in candidates], dtype=np.int64)
+
+    fingerprint = service.continuation_fingerprint(parent_path, req.n_estimators, req.learning_rate, X_delta, y_delta)
+    params = {"parent_id": parent_id, "n_estimators": req.n_estimators,
+              "learning_rate": req.learning_rate, "rows": len(candidates)}
+
+    with _submit_lock:
+        if not force:
+            model_id = service.find_model_by_fingerprint(fingerprint)
+            if model_id is not None:
+                return {"model_id": model_id, "deduplicated": True}
+
+            job_id = find_active_job(fingerprint)
+            if job_id is not None:
+                return {"job_id": job_id, "deduplicated": True}
+
+        with db.transaction() as cursor:
+            cursor.execute("""
+                INSERT INTO training_job (status, model_type, params, fingerprint, created_at)
+                VALUES (?, ?, ?, ?, ?)
+            """, (JOB_QUEUED, data.model_type, json.dumps(params), fingerprint, time.time()))
+            job_id = cursor.lastrowid
+
+        future = _get_executor().submit(
+            _run_continue_job, job_id, parent_path, data.model_type, req.n_estimators,
+            X_delta, y_delta, req.learning_rate,
+        )
+        future.add_done_callback(partial(_on_continue_done, job_id, data, fingerprint, parent_id))
+
+    return {"job_id": job_id, "deduplicated": False}
+
+def get_job(job_id: int) -> Optional[dict]:
+    row = db.get_connection().execute("""
+        SELECT id, status, model_type, params, model_id, error,
+               created_at, started_at, finished_at
+        FROM training_job WHERE id = ?
+    """, (job_id,)).fetchone()
+
+    if row is None:
+        return None
+
+    job_id, status, model_type, params, model_id, error, created_at, started_at, finished_at = row
+
+    return {
+        "id": job_id,
+        "status": status,
+        "model_type": model_type,
+        "params": json.loads(params),
+        "model_id": model_id,
+        "error": error,
+        "created_at": created_at,
+        "started_at": started_at,
+        "finished_at": finished_at,
+        "queued_seconds": (started_at - created_at) if started_at else None,
+        "run_seconds": (finished_at - started_at) if started_at and finished_at else None,
+    }
+
+def get_progress(job_id: int, since: int = -1) -> List[dict]:
+    """Validation metrics of each boosting iteration after ``since``."""
+    rows = db.get_connection().execute("""
+        SELECT iteration, elapsed, auc, logloss, best_iteration, stopped
+        FROM training_progress WHERE job_id = ? AND iteration > ?
+        ORDER BY iteration
+    """, (job_id, since)).fetchall()
+
+    return [
+        {
+            "iteration": iteration,
+            "elapsed": elapsed,
+            "auc": auc,
+            "logloss": logloss,
+            "best_iteration": best_iteration,
+            "stopped": stopped,
+        }
+        for iteration, elapsed, auc, logloss, best_iteration, stopped in rows
+    ]
@@ -1,9 +1,27 @@
 '''aqui se supone que debe de ir el bakend'''
-from fastapi import FastAPI
-from . import routes
+import time
+import itertools
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
+from fastapi.responses import Response
+from starlette.routing import Match
+from . import routes, jobs, sweeps, service, metrics
 from fastapi.middleware.cors import CORSMiddleware
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Every replica reads the model table, so its migrations always run
+    service.init_model_schema()
+    # A serving-only replica must not fail the jobs of the replica that trains
+    if not routes.INFERENCE_ONLY:
+        service.init_fingerprint_table()
+        jobs.init_jobs_table()
+        sweeps.init_sweeps_table()
+    yield
+    sweeps.shutdown()
+    jobs.shutdown()
+
+app = FastAPI(lifespan=lifespan)
 
 origins = [
     "http://localhost:5173",
@@ -20,3 +38,36 @@ app.add_middleware(
 
 app.include_router(routes.router)
 
+def route_template(request: Request) -> str:
+    """Ruta declarada (p. ej. /api/jobs/{job_id}) para no crear una serie por id."""
+    for route in itertools.chain(routes.router.routes, request.app.router.routes):
+        # Se omiten los routers incluidos; sus rutas ya están en routes.router
+        if not hasattr(route, "path"):
+            continue
+        match, _ = route.matches(request.scope)
+        if match == Match.FULL:
+            return route.path
+    return "unmatched"
+
+@app.middleware("http")
+async def track_requests(request: Request, call_next):
+    route = route_template(request)
+    if route == "/metrics":
+        return await call_next(request)
+
+    labels = {"method": request.method, "route": route}
+    metrics.HTTP_IN_FLIGHT.inc(**labels)
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        metrics.HTTP_IN_FLIGHT.dec(**labels)
+        metrics.HTTP_REQUEST_SECONDS.observe(time.perf_counter() - start, **labels)
+        metrics.HTTP_REQUESTS.inc(status=status, **labels)
+
+@app.get("/metrics", include_in_schema=False)
+def prometheus_metrics():
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
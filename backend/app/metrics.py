@@ -0,0 +1,213 @@
+"""In-process latency histograms, counters and gauges exported at ``/metrics``.
+
+The registry renders the Prometheus text exposition format itself, so no
+client library is needed. Stage timings pick up the ``model``/``model_type``
+labels of the request being served from a context variable set by the routes.
+"""
+import time
+import math
+import threading
+import contextvars
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, List, Tuple
+
+# Seconds; the serving stages go from sub-millisecond lookups to large CSV batches
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+TRAINING_BUCKETS = (0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0, 3600.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names, values, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted((key, (list(state[0]), state[1], state[2])) for key, state in self._values.items())
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+REGISTRY: List[_Metric] = []
+_collectors: List[Tuple[str, str, Callable[[], dict]]] = []
+
+def register_stats(prefix: str, help: str, stats: Callable[[], dict]):
+    """Export every numeric value of ``stats()`` as a gauge ``<prefix>_<key>`` on each scrape."""
+    _collectors.append((prefix, help, stats))
+
+def render() -> str:
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+
+    for prefix, help, stats in _collectors:
+        for key, value in stats().items():
+            if isinstance(value, bool):
+                value = int(value)
+            if not isinstance(value, (int, float)):
+                continue
+            name = f"{prefix}_{key}"
+            lines += [f"# HELP {name} {help} ({key})", f"# TYPE {name} gauge", f"{name} {_format_value(value)}"]
+
+    return "\n".join(lines) + "\n"
+
+HTTP_REQUESTS = Counter(
+    "exo_http_requests_total", "HTTP requests served.", ["method", "route", "status"])
+HTTP_REQUEST_SECONDS = Histogram(
+    "exo_http_request_duration_seconds", "End-to-end HTTP request latency.", ["method", "route"])
+HTTP_IN_FLIGHT = Gauge(
+    "exo_http_requests_in_flight", "HTTP requests currently being served.", ["method", "route"])
+
+STAGE_SECONDS = Histogram(
+    "exo_stage_duration_seconds",
+    "Latency of each serving stage (db_lookup, model_load, dataframe, predict, explain, serialize).",
+    ["stage", "model", "model_type"],
+)
+PREDICTED_ROWS = Counter(
+    "exo_predicted_rows_total", "Rows scored by a model.", ["model", "model_type"])
+
+TRAINING_PHASE_SECONDS = Histogram(
+    "exo_training_phase_duration_seconds",
+    "Latency of each training phase (load_data, split, fit, evaluate, save).",
+    ["phase", "model_type"],
+    buckets=TRAINING_BUCKETS,
+)
+
+_model_labels = contextvars.ContextVar("model_labels", default={"model": "", "model_type": ""})
+
+def set_model_labels(model, model_type):
+    """Label the stage metrics recorded for the rest of the current request."""
+    _model_labels.set({"model": "" if model is None else str(model), "model_type": model_type or ""})
+
+def model_labels() -> dict:
+    return dict(_model_labels.get())
+
+@contextmanager
+def stage(name: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - start, stage=name, **_model_labels.get())
+
+def count_predictions(n_rows: int):
+    if n_rows:
+        PREDICTED_ROWS.inc(n_rows, **_model_labels.get())
+
+# Training runs in worker processes whose registry is never scraped; phases are
+# also collected here so the parent can replay them with record_training_phases.
+_captured_phases = contextvars.ContextVar("captured_phases", default=None)
+
+def _record_phase(phase: str, model_type: str, elapsed: float):
+    TRAINING_PHASE_SECONDS.observe(elapsed, phase=phase, model_type=model_type)
+    captured = _captured_phases.get()
+    if captured is not None:
+        captured.append((phase, model_type, elapsed))
+
+class PhaseTimer:
+    """Times consecutive training phases: each ``mark(phase)`` closes the phase that just ended."""
+
+    def __init__(self, model_type: str):
+        self.model_type = model_type
+        self._last = time.perf_counter()
+
+    def mark(self, phase: str):
+        now = time.perf_counter()
+        _record_phase(phase, self.model_type, now - self._last)
+        self._last = now
+
+@contextmanager
+def capture_training_phases():
+    """Collect the (phase, model_type, seconds) tuples observed inside the block."""
+    captured = []
+    token = _captured_phases.set(captured)
+    try:
+        yield captured
+    finally:
+        _captured_phases.reset(token)
+
+def record_training_phases(phases: List[Tuple[str, str, float]]):
+    for phase, model_type, elapsed in phases:
+        TRAINING_PHASE_SECONDS.observe(elapsed, phase=phase, model_type=model_type)
@@ -0,0 +1,136 @@
+"""Formato de artefacto de carga inmediata, compartido entre procesos.
+
+Junto a cada ``modelo.joblib`` se escribe un directorio ``modelo.artifact/``:
+
+    meta.json               tipo, parámetros, métricas, características y escalares del ensamble
+    <campo>.npy             tablas de nodos del ``CompiledEnsemble`` (sin pickle)
+    booster.txt / .ubj      booster nativo de LightGBM / XGBoost, portable entre versiones
+
+Los ``.npy`` se abren con ``mmap_mode='r'``: cargar un modelo solo lee
+``meta.json`` y los workers que sirven el mismo modelo comparten sus páginas a
+través de la caché del sistema operativo en lugar de tener cada uno una copia.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import numpy as np
+from .compiled import CompiledEnsemble, compile_model, verify_compiled
+
+ARTIFACT_SUFFIX = ".artifact"
+ARTIFACT_FORMAT_VERSION = 1
+META_FILE = "meta.json"
+
+# Tablas del ensamble que se guardan como .npy; el resto va en meta.json
+ARRAY_FIELDS = (
+    "feature", "threshold", "left", "default_left", "missing_type",
+    "leaf_value", "roots", "classes", "is_leaf",
+)
+
+def artifact_path(model_path: str) -> str:
+    """Directorio del artefacto que acompaña a un ``.joblib``."""
+    return os.path.splitext(model_path)[0] + ARTIFACT_SUFFIX
+
+def read_metadata(path: str) -> dict:
+    with open(os.path.join(path, META_FILE)) as f:
+        return json.load(f)
+
+def load_artifact(path: str, mmap_mode: str = "r") -> CompiledEnsemble:
+    """Abre el ensamble de un artefacto; con ``mmap_mode=None`` lo lee a memoria."""
+    meta = read_metadata(path)
+    if meta.get("format_version") != ARTIFACT_FORMAT_VERSION:
+        raise ValueError(f"Versión de artefacto no soportada: {meta.get('format_version')}")
+
+    arrays = {
+        name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mmap_mode, allow_pickle=False)
+        for name in ARRAY_FIELDS
+    }
+    return CompiledEnsemble({**arrays, **meta["compiled"]})
+
+def _save_native(model, directory: str):
+    """Guarda el booster en el formato propio de la librería; devuelve su nombre o None."""
+    name = type(model).__name__
+    if name == "LGBMClassifier":
+        model.booster_.save_model(os.path.join(directory, "booster.txt"))
+        return "booster.txt"
+    if name == "XGBClassifier":
+        model.get_booster().save_model(os.path.join(directory, "booster.ubj"))
+        return "booster.ubj"
+    return None
+
+def write_artifact(compiled: CompiledEnsemble, model_path: str, model=None, metadata: dict = None) -> str:
+    """Escribe el artefacto de forma atómica y devuelve su ruta.
+
+    Se construye en un directorio temporal y se renombra al final; si ya existía,
+    el anterior se reemplaza. Los procesos que lo tengan mapeado siguen leyendo
+    los archivos viejos hasta que vuelvan a cargarlo.
+    """
+    target = artifact_path(model_path)
+    parent = os.path.dirname(os.path.abspath(target))
+    tmp_dir = tempfile.mkdtemp(dir=parent, prefix=".tmp-artifact-")
+
+    try:
+        arrays = compiled.to_arrays()
+        arrays["is_leaf"] = compiled.is_leaf
+        for name in ARRAY_FIELDS:
+            np.save(os.path.join(tmp_dir, f"{name}.npy"), np.ascontiguousarray(arrays[name]))
+
+        native = _save_native(model, tmp_dir) if model is not None else None
+
+        meta = {
+            **(metadata or {}),
+            "format_version": ARTIFACT_FORMAT_VERSION,
+            "source": os.path.basename(model_path),
+            "created_at": time.time(),
+            "features": compiled.feature_names,
+            "native": native,
+            "compiled": {
+                "feature_names": compiled.feature_names,
+                "kind": compiled.kind,
+                "strict": compiled.strict,
+                "input_dtype": compiled.input_dtype.name,
+                "base": compiled.base,
+                "scale": compiled.scale,
+                "depth": compiled.depth,
+            },
+        }
+        with open(os.path.join(tmp_dir, META_FILE), "w") as f:
+            json.dump(meta, f, indent=2, default=str)
+
+        old_dir = None
+        if os.path.isdir(target):
+            old_dir = tempfile.mkdtemp(dir=parent, prefix=".old-artifact-")
+            os.rename(target, os.path.join(old_dir, "artifact"))
+        os.rename(tmp_dir, target)
+        if old_dir is not None:
+            shutil.rmtree(old_dir, ignore_errors=True)
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+    return target
+
+def export_artifact(model, model_path: str, X, metadata: dict = None) -> str:
+    """Compila ``model``, lo verifica sobre ``X`` y escribe su artefacto junto al ``.joblib``."""
+    compiled = compile_model(model)
+    error = verify_compiled(model, compiled, X)
+    path = write_artifact(compiled, model_path, model, metadata)
+    print(f"Artefacto guardado como '{os.path.basename(path)}' (error máximo {error:.2e})")
+    return path
+
+def main():
+    """Convierte modelos existentes: python -m app.model.artifact <modelo.joblib> ..."""
+    import joblib
+    from .kepler import load_kepler_data
+
+    X, _ = load_kepler_data()
+    for model_path in sys.argv[1:]:
+        try:
+            export_artifact(joblib.load(model_path), model_path, X)
+        except ValueError as e:
+            print(f"No se pudo convertir '{model_path}': {e}")
+
+if __name__ == '__main__':
+    main()
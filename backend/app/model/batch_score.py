@@ -0,0 +1,188 @@
+"""Puntuación por lotes de catálogos completos, fuera del servidor.
+
+    python -m app.model.batch_score events.csv -o predictions.csv --model 3 \\
+        --chunk-size 50000 --workers 4
+
+El CSV se lee por bloques; cada bloque se puntúa con ``predict_batch`` en un
+pool de procesos donde cada worker carga el modelo una sola vez, y los
+resultados se escriben en orden con una escritura por bloque. La salida es CSV
+(mismo formato que ``predictions.csv``) o Parquet si termina en ``.parquet``.
+"""
+import os
+import sys
+import time
+import argparse
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from .predict import predict_batch, load_model
+from .features import KOI_FEATURES, to_matrix, as_frame
+from .. import governor
+
+DEFAULT_CHUNK_SIZE = 50000
+
+KOI_COLUMNS = [koi for koi, _ in KOI_FEATURES]
+COLUMN_MAP = {tce: koi for koi, tce in KOI_FEATURES}
+
+def count_comment_lines(path: str) -> int:
+    """Líneas ``#`` al inicio del archivo, como en los CSV del NASA Exoplanet Archive."""
+    count = 0
+    with open(path) as f:
+        for line in f:
+            if not line.startswith("#"):
+                break
+            count += 1
+    return count
+
+def prepare_chunk(chunk: pd.DataFrame) -> pd.DataFrame:
+    """Columnas de ``KOI_FEATURES`` (acepta los nombres ``tce_*``) convertidas a números.
+
+    A diferencia de la API, los valores faltantes se dejan como NaN: los árboles
+    los envían por su rama por defecto, igual que al entrenar.
+    """
+    chunk = chunk.rename(columns=lambda column: COLUMN_MAP.get(column.strip().lower(), column.strip().lower()))
+    missing = [column for column in KOI_COLUMNS if column not in chunk.columns]
+    if missing:
+        raise ValueError(f"Faltan columnas en el archivo de entrada: {', '.join(missing)}")
+    return as_frame(to_matrix(chunk))
+
+def _init_worker(model_path: str, threads: int):
+    # Cada worker usa su parte de los núcleos en lugar de competir por todos
+    governor.INFERENCE_THREADS = threads
+    load_model(model_path)
+
+def score_chunk(model_path: str, features: pd.DataFrame):
+    verdicts, confidences = predict_batch(model_path, features)
+    if verdicts is None:
+        raise FileNotFoundError(f"No se encontró el archivo del modelo en '{model_path}'")
+    return verdicts, confidences
+
+class _CsvSink:
+    def __init__(self, path: str):
+        self.path = path
+        self.header = True
+
+    def write(self, frame: pd.DataFrame):
+        frame = frame.assign(confidence=np.char.mod("%.2f%%", frame["confidence"].to_numpy() * 100))
+        frame.to_csv(self.path, mode="w" if self.header else "a", header=self.header, index=False)
+        self.header = False
+
+    def close(self):
+        if self.header:
+            pd.DataFrame(columns=["verdict", "confidence"]).to_csv(self.path, index=False)
+
+class _ParquetSink:
+    def __init__(self, path: str):
+        try:
+            import pyarrow
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise SystemExit("La salida Parquet requiere pyarrow: pip install pyarrow")
+        self.pyarrow = pyarrow
+        self.pq = pq
+        self.path = path
+        self.writer = None
+
+    def write(self, frame: pd.DataFrame):
+        table = self.pyarrow.Table.from_pandas(frame, preserve_index=False)
+        if self.writer is None:
+            self.writer = self.pq.ParquetWriter(self.path, table.schema)
+        self.writer.write_table(table)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+def open_sink(path: str):
+    return _ParquetSink(path) if path.endswith(".parquet") else _CsvSink(path)
+
+def _read_chunks(input_path: str, chunk_size: int, id_columns: list):
+    reader = pd.read_csv(input_path, skiprows=count_comment_lines(input_path), chunksize=chunk_size)
+    for chunk in reader:
+        ids = chunk[[column for column in id_columns if column in chunk.columns]].reset_index(drop=True)
+        yield ids, prepare_chunk(chunk)
+
+def score_file(input_path: str, output_path: str, model_path: str,
+               chunk_size: int = DEFAULT_CHUNK_SIZE, workers: int = None,
+               id_columns: list = ("kepid",)) -> int:
+    """Puntúa ``input_path`` completo y escribe ``output_path``; devuelve el número de filas.
+
+    Con ``workers`` <= 1 todo corre en este proceso. Como máximo hay dos bloques
+    por worker en vuelo, así la memoria no depende del tamaño del catálogo.
+    """
+    if not os.path.exists(model_path):
+        raise FileNotFoundError(f"No se encontró el archivo del modelo en '{model_path}'")
+
+    workers = workers or os.cpu_count() or 1
+    sink = open_sink(output_path)
+    chunks = _read_chunks(input_path, chunk_size, list(id_columns))
+    rows = 0
+
+    def emit(ids, verdicts, confidences):
+        nonlocal rows
+        sink.write(ids.assign(verdict=verdicts, confidence=confidences))
+        rows += len(ids)
+
+    try:
+        if workers <= 1:
+            for ids, features in chunks:
+                emit(ids, *score_chunk(model_path, features))
+            return rows
+
+        threads = max(1, (os.cpu_count() or 1) // workers)
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(model_path, threads),
+        ) as executor:
+            pending = deque()
+            for ids, features in chunks:
+                pending.append((ids, executor.submit(score_chunk, model_path, features)))
+                if len(pending) >= 2 * workers:
+                    ids, future = pending.popleft()
+                    emit(ids, *future.result())
+            while pending:
+                ids, future = pending.popleft()
+                emit(ids, *future.result())
+    finally:
+        sink.close()
+
+    return rows
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Puntúa un catálogo completo de candidatos.")
+    parser.add_argument("input", help="CSV con columnas koi_* o tce_* (se ignoran las líneas # iniciales)")
+    parser.add_argument("-o", "--output", default="predictions.csv", help="Archivo de salida .csv o .parquet")
+    parser.add_argument("--model", type=int, default=None, help="Id del modelo registrado; vacío usa el modelo base")
+    parser.add_argument("--model-path", default=None, help="Ruta a un .joblib (tiene prioridad sobre --model)")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="Filas por bloque")
+    parser.add_argument("--workers", type=int, default=None, help="Procesos de puntuación (por defecto, uno por núcleo)")
+    parser.add_argument("--id-columns", default="kepid", help="Columnas de la entrada copiadas a la salida, separadas por comas")
+    args = parser.parse_args(argv)
+
+    model_path = args.model_path
+    if model_path is None:
+        from .. import service
+        model_path = service.get_model(args.model)
+
+    start = time.perf_counter()
+    try:
+        rows = score_file(
+            args.input, args.output, model_path,
+            chunk_size=args.chunk_size,
+            workers=args.workers,
+            id_columns=[column for column in args.id_columns.split(",") if column],
+        )
+    except (FileNotFoundError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+
+    elapsed = time.perf_counter() - start
+    print(f"{rows} filas puntuadas en {elapsed:.2f}s ({rows / elapsed if elapsed else 0:.0f} filas/s) -> '{args.output}'")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,108 @@
+"""Agrupa predicciones concurrentes del mismo modelo en un solo lote.
+
+Cada modelo tiene un hilo que espera la primera petición, sigue recogiendo
+durante ``PREDICT_BATCH_WINDOW_MS`` (o hasta ``PREDICT_BATCH_MAX_SIZE``) y
+evalúa todas juntas con ``predict_batch``. La latencia extra por petición
+está acotada por la ventana más el tiempo de inferencia del lote.
+"""
+import os
+import time
+import queue
+import threading
+from concurrent.futures import Future
+from .predict import predict_batch
+from .features import to_matrix, as_frame
+from .. import metrics
+
+# Desactivado por defecto; PREDICT_BATCHING=1 lo habilita
+PREDICT_BATCHING = os.environ.get("PREDICT_BATCHING", "0") == "1"
+PREDICT_BATCH_WINDOW_MS = float(os.environ.get("PREDICT_BATCH_WINDOW_MS", 2))
+PREDICT_BATCH_MAX_SIZE = int(os.environ.get("PREDICT_BATCH_MAX_SIZE", 64))
+
+class MicroBatcher:
+    """Cola de predicciones pendientes para un único modelo."""
+
+    def __init__(self, model_path: str, window_ms: float = PREDICT_BATCH_WINDOW_MS,
+                 max_size: int = PREDICT_BATCH_MAX_SIZE):
+        self.model_path = model_path
+        self.window = window_ms / 1000.0
+        self.max_size = max_size
+        self.batches = 0
+        self.requests = 0
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name=f"batcher-{os.path.basename(model_path)}", daemon=True)
+        self._thread.start()
+
+    def submit(self, features: dict) -> Future:
+        future = Future()
+        self._queue.put((features, future))
+        return future
+
+    def _collect(self) -> list:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.window
+
+        while len(batch) < self.max_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            futures = [future for _, future in batch]
+
+            try:
+                with metrics.stage("dataframe"):
+                    features_df = as_frame(to_matrix([features for features, _ in batch]))
+                verdicts, confidences = predict_batch(self.model_path, features_df)
+            except Exception as e:
+                for future in futures:
+                    future.set_exception(e)
+                continue
+
+            self.batches += 1
+            self.requests += len(batch)
+
+            if verdicts is None:
+                for future in futures:
+                    future.set_result((None, None))
+                continue
+
+            for future, verdict, confidence in zip(futures, verdicts.tolist(), confidences.tolist()):
+                future.set_result((verdict, confidence))
+
+_batchers = {}
+_batchers_lock = threading.Lock()
+
+def get_batcher(model_path: str) -> MicroBatcher:
+    with _batchers_lock:
+        batcher = _batchers.get(model_path)
+        if batcher is None:
+            batcher = _batchers[model_path] = MicroBatcher(model_path)
+        return batcher
+
+def predict_candidate_batched(model_path, candidate_features):
+    """Igual que ``predict_candidate`` pero compartiendo lote con otras peticiones."""
+    return get_batcher(model_path).submit(candidate_features).result()
+
+def batching_stats() -> dict:
+    with _batchers_lock:
+        batchers = list(_batchers.values())
+
+    batches = sum(b.batches for b in batchers)
+    requests = sum(b.requests for b in batchers)
+    return {
+        "enabled": PREDICT_BATCHING,
+        "window_ms": PREDICT_BATCH_WINDOW_MS,
+        "max_size": PREDICT_BATCH_MAX_SIZE,
+        "batches": batches,
+        "requests": requests,
+        "mean_batch_size": requests / batches if batches else 0.0,
+    }
@@ -0,0 +1,128 @@
+"""Caché de los datasets binados de LightGBM y XGBoost.
+
+Antes de entrenar, LightGBM agrupa cada característica en un histograma y
+XGBoost calcula sus cuantiles; con los mismos datos el resultado es siempre el
+mismo, pero se recalculaba en cada prueba de hiperparámetros. Aquí se guardan
+por (dataset, partición, parámetros de binado):
+
+* LightGBM: ``Dataset.save_binary`` en el directorio de la caché del dataset,
+  así cualquier proceso lo reabre sin volver a binar. Se construye con
+  ``feature_pre_filter=False`` para poder reutilizarlo con cualquier
+  ``min_child_samples``.
+* XGBoost: ``QuantileDMatrix`` no se puede serializar, así que se conserva en
+  memoria del proceso; los workers del pool de entrenamiento viven entre
+  trabajos y la reutilizan.
+
+La partición la nombra quien llama (p. ej. ``train_0.25``) y debe identificar
+las filas de entrenamiento y de evaluación dentro del directorio del dataset.
+"""
+import os
+import json
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+
+# Datasets construidos que se mantienen en memoria en cada proceso; 0 desactiva la caché
+BINNED_CACHE_MAX_ENTRIES = int(os.environ.get("BINNED_CACHE_MAX_ENTRIES", 16))
+
+# Parámetros que cambian cómo se construyen los bins; el resto se puede variar sin reconstruir
+LIGHTGBM_BINNING_PARAMS = ("max_bin", "min_data_in_bin", "subsample_for_bin", "random_state")
+XGBOOST_BINNING_PARAMS = ("max_bin",)
+
+class BinnedCache:
+    def __init__(self, max_entries: int = BINNED_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, entry):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+BINNED_CACHE = BinnedCache()
+
+def _binning(params: dict, names: tuple) -> dict:
+    return {name: params[name] for name in names if params.get(name) is not None}
+
+def _cache_key(library: str, directory: str, split: str, binning: dict) -> str:
+    payload = {"library": library, "directory": os.path.abspath(directory), "split": split, "binning": binning}
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+def lightgbm_dataset(directory: str, split: str, X, y, params: dict):
+    """``lgb.Dataset`` ya construido para ``X``/``y``, leído de la caché si existe."""
+    import lightgbm as lgb
+
+    binning = _binning(params, LIGHTGBM_BINNING_PARAMS)
+    key = _cache_key("lightgbm", directory, split, binning)
+    dataset = BINNED_CACHE.get(key)
+    if dataset is not None:
+        return dataset
+
+    dataset_params = {**binning, "feature_pre_filter": False, "verbose": -1}
+    path = os.path.join(directory, f"lightgbm_{key[:16]}.bin")
+    if not os.path.exists(path):
+        # Escritura atómica: otro worker puede estar binando la misma partición
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=".bin")
+        os.close(fd)
+        os.remove(tmp_path)
+        try:
+            lgb.Dataset(X, y, params=dataset_params).construct().save_binary(tmp_path)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    dataset = lgb.Dataset(path, params=dataset_params).construct()
+    BINNED_CACHE.put(key, dataset)
+    return dataset
+
+def xgboost_matrices(directory: str, split: str, X_train, y_train, X_eval=None, y_eval=None, params: dict = None):
+    """``(dtrain, deval)`` como ``QuantileDMatrix``; ``deval`` usa los cuantiles de ``dtrain``.
+
+    ``deval`` es None sin conjunto de evaluación.
+    """
+    import xgboost as xgb
+
+    binning = _binning(params or {}, XGBOOST_BINNING_PARAMS)
+    key = (_cache_key("xgboost", directory, split, binning), X_eval is not None)
+    matrices = BINNED_CACHE.get(key)
+    if matrices is not None:
+        return matrices
+
+    dtrain = xgb.QuantileDMatrix(X_train, y_train, **binning)
+    deval = xgb.QuantileDMatrix(X_eval, y_eval, ref=dtrain) if X_eval is not None else None
+    BINNED_CACHE.put(key, (dtrain, deval))
+    return dtrain, deval
@@ -0,0 +1,388 @@
+"""Evaluador NumPy de ensambles de árboles para servir predicciones con baja latencia.
+
+Los modelos entrenados con LightGBM, XGBoost o Random Forest se aplanan en
+tablas de nodos (feature, umbral, hijos, valor de hoja) y se evalúan de forma
+vectorizada, sin pasar por la validación de DataFrames de cada librería.
+"""
+import os
+import sys
+import json
+import numpy as np
+import pandas as pd
+
+# Tipos de valores faltantes por nodo (mismo significado que en LightGBM)
+MISSING_NONE = 0   # NaN se trata como 0 y se compara con el umbral
+MISSING_ZERO = 1   # 0 y NaN van por la rama por defecto
+MISSING_NAN = 2    # solo NaN va por la rama por defecto
+
+_ZERO_THRESHOLD = 1e-35
+
+# Máximo de celdas (filas x árboles) que se evalúan a la vez
+_MAX_CELLS = 1 << 20
+# A partir de este número de celdas vale la pena compactar las ya terminadas
+_COMPACT_MIN_CELLS = 4096
+
+COMPILED_SUFFIX = ".compiled.npz"
+
+def compiled_path(model_path: str) -> str:
+    """Ruta del artefacto compilado que acompaña a un ``.joblib``."""
+    return os.path.splitext(model_path)[0] + COMPILED_SUFFIX
+
+class CompiledEnsemble:
+    """Ensamble de árboles guardado como arreglos planos.
+
+    Imita la interfaz ``predict_proba``/``predict``/``classes_`` de los
+    clasificadores originales para poder usarse en su lugar.
+    """
+
+    def __init__(self, arrays: dict):
+        self.feature = arrays["feature"]
+        self.threshold = arrays["threshold"]
+        self.left = arrays["left"]
+        self.default_left = arrays["default_left"]
+        self.missing_type = arrays["missing_type"]
+        self.leaf_value = arrays["leaf_value"]
+        self.roots = arrays["roots"]
+        self.classes_ = arrays["classes"]
+        self.feature_names = [str(name) for name in arrays["feature_names"]]
+        self.kind = str(arrays["kind"])
+        self.strict = bool(arrays["strict"])
+        self.input_dtype = np.dtype(str(arrays["input_dtype"]))
+        self.base = float(arrays["base"])
+        self.scale = float(arrays["scale"])
+        self.depth = int(arrays["depth"])
+        # Las hojas apuntan a sí mismas; el hijo derecho siempre es left + 1
+        if "is_leaf" in arrays:
+            self.is_leaf = arrays["is_leaf"]
+        else:
+            self.is_leaf = self.left == np.arange(len(self.left))
+        self._has_missing_none = bool((self.missing_type == MISSING_NONE).any())
+        self._has_missing_zero = bool((self.missing_type == MISSING_ZERO).any())
+
+    def to_arrays(self) -> dict:
+        return {
+            "feature": self.feature,
+            "threshold": self.threshold,
+            "left": self.left,
+            "default_left": self.default_left,
+            "missing_type": self.missing_type,
+            "leaf_value": self.leaf_value,
+            "roots": self.roots,
+            "classes": self.classes_,
+            "feature_names": np.array(self.feature_names),
+            "kind": np.array(self.kind),
+            "strict": np.array(self.strict),
+            "input_dtype": np.array(self.input_dtype.name),
+            "base": np.array(self.base),
+            "scale": np.array(self.scale),
+            "depth": np.array(self.depth),
+        }
+
+    def save(self, path: str):
+        np.savez(path, **self.to_arrays())
+
+    @classmethod
+    def load(cls, path: str) -> "CompiledEnsemble":
+        with np.load(path, allow_pickle=False) as data:
+            return cls({name: data[name] for name in data.files})
+
+    def _as_matrix(self, X) -> np.ndarray:
+        if isinstance(X, pd.DataFrame):
+            X = X[self.feature_names].to_numpy()
+        X = np.asarray(X)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        # Se replica la precisión con la que compara cada librería
+        return X.astype(self.input_dtype, copy=False).astype(np.float64, copy=False)
+
+    def _step(self, X_flat, offset, node, finite):
+        x = X_flat[offset + self.feature[node]]
+        threshold = self.threshold[node]
+
+        if finite:
+            # Sin faltantes: las hojas tienen umbral +inf y nunca avanzan
+            go_right = x >= threshold if self.strict else x > threshold
+            return self.left[node] + go_right
+
+        missing_type = self.missing_type[node]
+        is_nan = np.isnan(x)
+        if self._has_missing_none:
+            x = np.where(is_nan & (missing_type == MISSING_NONE), 0.0, x)
+
+        missing = is_nan & (missing_type != MISSING_NONE)
+        if self._has_missing_zero:
+            missing |= (missing_type == MISSING_ZERO) & (np.abs(x) <= _ZERO_THRESHOLD)
+
+        go_left = x < threshold if self.strict else x <= threshold
+        go_left = np.where(missing, self.default_left[node], go_left) | self.is_leaf[node]
+        return self.left[node] + ~go_left
+
+    def _raw_scores(self, X: np.ndarray) -> np.ndarray:
+        n_rows, n_features = X.shape
+        n_trees = len(self.roots)
+        finite = not self._has_missing_zero and bool(np.isfinite(X).all())
+
+        # Una celda por (fila, árbol); 'offset' apunta al inicio de la fila en X
+        X_flat = X.ravel()
+        node = np.tile(self.roots, n_rows)
+        offset = np.repeat(np.arange(n_rows) * n_features, n_trees)
+        raw = np.zeros(n_rows)
+
+        for _ in range(self.depth):
+            node = self._step(X_flat, offset, node, finite)
+
+            # En lotes grandes se descartan las celdas que ya llegaron a una hoja
+            if len(node) > _COMPACT_MIN_CELLS:
+                done = self.is_leaf[node]
+                if done.sum() * 2 > len(node):
+                    raw += np.bincount(offset[done] // n_features, self.leaf_value[node[done]], minlength=n_rows)
+                    node, offset = node[~done], offset[~done]
+
+        raw += np.bincount(offset // n_features, self.leaf_value[node], minlength=n_rows)
+        return raw
+
+    def predict_positive(self, X) -> np.ndarray:
+        """Probabilidad de la clase ``classes_[1]`` para cada fila."""
+        X = self._as_matrix(X)
+        raw = np.zeros(len(X))
+        step = max(1, _MAX_CELLS // max(1, len(self.roots)))
+        for start in range(0, len(X), step):
+            raw[start:start + step] = self._raw_scores(X[start:start + step])
+
+        if self.kind == "sigmoid":
+            return 1.0 / (1.0 + np.exp(-self.scale * (raw + self.base)))
+        return raw / len(self.roots)
+
+    def predict_proba(self, X) -> np.ndarray:
+        positive = self.predict_positive(X)
+        return np.column_stack([1.0 - positive, positive])
+
+    def predict(self, X) -> np.ndarray:
+        return self.classes_[self.predict_proba(X).argmax(axis=1)]
+
+class _TreeBuilder:
+    """Acumula nodos de varios árboles en tablas globales.
+
+    Los dos hijos de cada división ocupan posiciones consecutivas, así el
+    evaluador solo necesita ``left`` (el derecho es ``left + 1``).
+    """
+
+    def __init__(self):
+        self.feature, self.threshold, self.left = [], [], []
+        self.default_left, self.missing_type = [], []
+        self.leaf_value, self.roots = [], []
+        self.depth = 0
+
+    def new_nodes(self, count: int) -> int:
+        """Reserva ``count`` hojas consecutivas y devuelve el índice de la primera."""
+        first = len(self.feature)
+        for index in range(first, first + count):
+            self.feature.append(0)
+            self.threshold.append(np.inf)
+            self.left.append(index)
+            self.default_left.append(False)
+            self.missing_type.append(MISSING_NAN)
+            self.leaf_value.append(0.0)
+        return first
+
+    def new_tree(self) -> int:
+        root = self.new_nodes(1)
+        self.roots.append(root)
+        return root
+
+    def set_leaf(self, index: int, value: float):
+        self.leaf_value[index] = value
+
+    def set_split(self, index: int, feature: int, threshold: float, default_left: bool,
+                  missing_type: int = MISSING_NAN) -> int:
+        """Convierte el nodo en una división y devuelve el índice del hijo izquierdo."""
+        left = self.new_nodes(2)
+        self.feature[index] = feature
+        self.threshold[index] = threshold
+        self.left[index] = left
+        self.default_left[index] = default_left
+        self.missing_type[index] = missing_type
+        return left
+
+    def build(self, model, feature_names, kind, strict, input_dtype, base=0.0, scale=1.0) -> CompiledEnsemble:
+        return CompiledEnsemble({
+            "feature": np.asarray(self.feature, dtype=np.int32),
+            "threshold": np.asarray(self.threshold, dtype=np.float64),
+            "left": np.asarray(self.left, dtype=np.int32),
+            "default_left": np.asarray(self.default_left, dtype=bool),
+            "missing_type": np.asarray(self.missing_type, dtype=np.int8),
+            "leaf_value": np.asarray(self.leaf_value, dtype=np.float64),
+            "roots": np.asarray(self.roots, dtype=np.int32),
+            "classes": np.asarray(model.classes_),
+            "feature_names": np.array(list(feature_names)),
+            "kind": np.array(kind),
+            "strict": np.array(strict),
+            "input_dtype": np.array(np.dtype(input_dtype).name),
+            "base": np.array(base),
+            "scale": np.array(scale),
+            "depth": np.array(self.depth),
+        })
+
+def _compile_lightgbm(model) -> CompiledEnsemble:
+    dump = model.booster_.dump_model()
+    if dump["num_class"] != 1 or not dump["objective"].startswith("binary"):
+        raise ValueError(f"Objetivo de LightGBM no soportado: {dump['objective']}")
+
+    scale = 1.0
+    for token in dump["objective"].split():
+        if token.startswith("sigmoid:"):
+            scale = float(token.split(":", 1)[1])
+
+    missing_types = {"None": MISSING_NONE, "Zero": MISSING_ZERO, "NaN": MISSING_NAN}
+    builder = _TreeBuilder()
+
+    for tree in dump["tree_info"]:
+        stack = [(tree["tree_structure"], builder.new_tree(), 0)]
+        while stack:
+            node, index, depth = stack.pop()
+            builder.depth = max(builder.depth, depth)
+
+            if "leaf_value" in node:
+                builder.set_leaf(index, node["leaf_value"])
+                continue
+
+            if node["decision_type"] != "<=":
+                raise ValueError("Solo se soportan divisiones numéricas de LightGBM.")
+            left = builder.set_split(
+                index,
+                feature=node["split_feature"],
+                threshold=node["threshold"],
+                default_left=node["default_left"],
+                missing_type=missing_types[node["missing_type"]],
+            )
+            stack.append((node["left_child"], left, depth + 1))
+            stack.append((node["right_child"], left + 1, depth + 1))
+
+    return builder.build(model, dump["feature_names"], "sigmoid", strict=False,
+                         input_dtype=np.float64, scale=scale)
+
+def _compile_xgboost(model) -> CompiledEnsemble:
+    booster = model.get_booster()
+    config = json.loads(booster.save_config())
+    learner = config["learner"]
+
+    if learner["objective"]["name"] != "binary:logistic":
+        raise ValueError(f"Objetivo de XGBoost no soportado: {learner['objective']['name']}")
+
+    base_score = float(str(learner["learner_model_param"]["base_score"]).strip("[]"))
+    base = float(np.log(base_score / (1.0 - base_score)))
+
+    feature_names = booster.feature_names or [f"f{i}" for i in range(booster.num_features())]
+    feature_index = {name: i for i, name in enumerate(feature_names)}
+
+    trees = booster.get_dump(dump_format="json")
+    best_iteration = booster.attr("best_iteration")
+    if best_iteration is not None:
+        trees = trees[:(int(best_iteration) + 1) * max(1, int(getattr(model, "num_parallel_tree", None) or 1))]
+
+    builder = _TreeBuilder()
+    for tree_json in trees:
+        stack = [(json.loads(tree_json), builder.new_tree(), 0)]
+        while stack:
+            node, index, depth = stack.pop()
+            builder.depth = max(builder.depth, depth)
+
+            if "leaf" in node:
+                builder.set_leaf(index, node["leaf"])
+                continue
+
+            children = {child["nodeid"]: child for child in node["children"]}
+            left = builder.set_split(
+                index,
+                feature=feature_index[node["split"]],
+                threshold=float(np.float32(node["split_condition"])),
+                default_left=node["missing"] == node["yes"],
+            )
+            stack.append((children[node["yes"]], left, depth + 1))
+            stack.append((children[node["no"]], left + 1, depth + 1))
+
+    return builder.build(model, feature_names, "sigmoid", strict=True,
+                         input_dtype=np.float32, base=base)
+
+def _compile_random_forest(model) -> CompiledEnsemble:
+    if len(model.classes_) != 2:
+        raise ValueError("Solo se soportan bosques de clasificación binaria.")
+
+    feature_names = getattr(model, "feature_names_in_", None)
+    if feature_names is None:
+        feature_names = [f"f{i}" for i in range(model.n_features_in_)]
+
+    builder = _TreeBuilder()
+    for estimator in model.estimators_:
+        tree = estimator.tree_
+        value = tree.value[:, 0, :]
+        positive = value[:, 1] / value.sum(axis=1)
+        missing_go_to_left = getattr(tree, "missing_go_to_left", None)
+
+        stack = [(0, builder.new_tree())]
+        while stack:
+            node, index = stack.pop()
+
+            if tree.children_left[node] == -1:
+                builder.set_leaf(index, positive[node])
+                continue
+
+            left = builder.set_split(
+                index,
+                feature=tree.feature[node],
+                threshold=tree.threshold[node],
+                default_left=bool(missing_go_to_left[node]) if missing_go_to_left is not None else False,
+            )
+            stack.append((tree.children_left[node], left))
+            stack.append((tree.children_right[node], left + 1))
+
+        builder.depth = max(builder.depth, tree.max_depth)
+
+    return builder.build(model, feature_names, "mean", strict=False, input_dtype=np.float32)
+
+def compile_model(model) -> CompiledEnsemble:
+    """Convierte un LGBMClassifier, XGBClassifier o RandomForestClassifier entrenado."""
+    name = type(model).__name__
+    if name == "LGBMClassifier":
+        return _compile_lightgbm(model)
+    if name == "XGBClassifier":
+        return _compile_xgboost(model)
+    if name == "RandomForestClassifier":
+        return _compile_random_forest(model)
+    raise ValueError(f"Modelo no soportado para compilar: {name}")
+
+def verify_compiled(model, compiled: CompiledEnsemble, X, atol: float = 1e-5) -> float:
+    """Compara las probabilidades con la librería original y devuelve el error máximo.
+
+    Lanza ``ValueError`` si la diferencia supera ``atol``.
+    """
+    expected = model.predict_proba(X)[:, 1]
+    actual = compiled.predict_positive(X)
+    error = float(np.max(np.abs(expected - actual))) if len(expected) else 0.0
+    if error > atol:
+        raise ValueError(f"El modelo compilado difiere del original (error máximo {error:.2e}).")
+    return error
+
+def export_compiled(model, model_path: str, X) -> str:
+    """Compila ``model``, lo verifica sobre ``X`` y lo guarda junto al ``.joblib``."""
+    compiled = compile_model(model)
+    error = verify_compiled(model, compiled, X)
+    path = compiled_path(model_path)
+    compiled.save(path)
+    print(f"Modelo compilado guardado como '{os.path.basename(path)}' (error máximo {error:.2e})")
+    return path
+
+def main():
+    """Compila artefactos ya existentes: python -m app.model.compiled <modelo.joblib> ..."""
+    import joblib
+    from .kepler import load_kepler_data
+
+    X, _ = load_kepler_data()
+    for model_path in sys.argv[1:]:
+        try:
+            export_compiled(joblib.load(model_path), model_path, X)
+        except ValueError as e:
+            print(f"No se pudo compilar '{model_path}': {e}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+"""Evalúa varios modelos sobre la misma matriz de características y los combina."""
+import os
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from .predict import predict_positive_batch
+from .. import metrics
+
+ENSEMBLE_MAX_WORKERS = int(os.environ.get("ENSEMBLE_MAX_WORKERS", min(8, os.cpu_count() or 1)))
+
+# soft_vote: promedio simple de probabilidades.
+# weighted_vote: promedio ponderado por el ROC-AUC guardado de cada modelo.
+ENSEMBLE_METHODS = ("soft_vote", "weighted_vote")
+
+# LightGBM, XGBoost y sklearn liberan el GIL durante la inferencia
+_pool = ThreadPoolExecutor(max_workers=ENSEMBLE_MAX_WORKERS, thread_name_prefix="ensemble")
+
+def verdicts_from_positive(positive: np.ndarray):
+    """Convierte probabilidades de CANDIDATE en (verdicts, confidences)."""
+    is_candidate = positive > 0.5
+    verdicts = np.where(is_candidate, 'CANDIDATE', 'FALSE POSITIVE')
+    confidences = np.where(is_candidate, positive, 1.0 - positive)
+    return verdicts, confidences
+
+def _score(model: dict, features_df) -> dict:
+    # Corre en un hilo del pool: las etiquetas de métricas se fijan por modelo
+    metrics.set_model_labels(model["id"] if model["id"] is not None else "base", model["model_type"] or "base")
+    try:
+        positive = predict_positive_batch(model["path"], features_df)
+        error = None if positive is not None else "No se encontró el archivo del modelo."
+    except Exception as e:
+        positive, error = None, str(e) or type(e).__name__
+    return {**model, "positive": positive, "error": error}
+
+def score_models(models: list, features_df) -> list:
+    """Evalúa en paralelo cada modelo de ``models`` (dicts con 'path') sobre ``features_df``."""
+    return list(_pool.map(lambda model: _score(model, features_df), models))
+
+def combine(scored: list, methods) -> dict:
+    """Combina las probabilidades de los modelos que no fallaron."""
+    valid = [entry for entry in scored if entry["positive"] is not None]
+    if not valid or not methods:
+        return {}
+
+    probabilities = np.vstack([entry["positive"] for entry in valid])
+    combined = {}
+
+    if "soft_vote" in methods:
+        combined["soft_vote"] = probabilities.mean(axis=0)
+
+    if "weighted_vote" in methods:
+        weights = np.array([entry.get("roc_auc") or 1.0 for entry in valid])
+        combined["weighted_vote"] = np.average(probabilities, axis=0, weights=weights)
+
+    return combined
@@ -0,0 +1,254 @@
+"""Importancia de características y contribuciones por candidato.
+
+LightGBM y XGBoost calculan TreeSHAP exacto de forma nativa (``pred_contrib``)
+en espacio log-odds. Random Forest no tiene una implementación nativa, así que
+se usa la atribución por camino (Saabas): cada división reparte la diferencia de
+probabilidad entre el nodo y su hijo a la característica que la decide. En los
+dos casos ``base_value + sum(contribuciones)`` reproduce la salida del modelo.
+
+Las contribuciones de las filas ya explicadas se guardan en una caché LRU con la
+misma clave por fila y la misma invalidación por mtime que ``result_cache``.
+"""
+import os
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from .predict import load_model
+from .artifact import artifact_path, read_metadata
+from .features import FEATURE_NAMES, to_matrix, model_feature_names, check_feature_order
+from .result_cache import row_keys, _artifact_version
+from .. import metrics, governor
+
+# Número máximo de filas explicadas guardadas; 0 desactiva la caché
+EXPLANATION_CACHE_MAX_ENTRIES = int(os.environ.get("EXPLANATION_CACHE_MAX_ENTRIES", 10000))
+
+METHOD_TREE_SHAP = "tree_shap"
+METHOD_SAABAS = "saabas"
+OUTPUT_LOG_ODDS = "log_odds"
+OUTPUT_PROBABILITY = "probability"
+
+# Método de atribución y espacio de salida de cada tipo de modelo
+EXPLAINERS = {
+    "LGBMClassifier": (METHOD_TREE_SHAP, OUTPUT_LOG_ODDS),
+    "XGBClassifier": (METHOD_TREE_SHAP, OUTPUT_LOG_ODDS),
+    "RandomForestClassifier": (METHOD_SAABAS, OUTPUT_PROBABILITY),
+}
+
+def _model_kind(model) -> str:
+    name = type(model).__name__
+    if name not in EXPLAINERS:
+        raise ValueError(f"Tipo de modelo no soportado para explicaciones: {name}")
+    return name
+
+def model_features(model) -> list:
+    """Columnas en el orden con el que se entrenó el modelo."""
+    _model_kind(model)
+    return model_feature_names(model) or list(FEATURE_NAMES)
+
+def feature_importance(model) -> list:
+    """Ganancia normalizada y número de divisiones de cada característica, de mayor a menor ganancia.
+
+    Para Random Forest la ganancia es la reducción media de impureza de scikit-learn.
+    """
+    kind = _model_kind(model)
+    features = model_features(model)
+
+    if kind == "LGBMClassifier":
+        gain = model.booster_.feature_importance(importance_type="gain")
+        split = model.booster_.feature_importance(importance_type="split")
+    elif kind == "XGBClassifier":
+        booster = model.get_booster()
+        total_gain = booster.get_score(importance_type="total_gain")
+        weight = booster.get_score(importance_type="weight")
+        gain = [total_gain.get(name, 0.0) for name in features]
+        split = [weight.get(name, 0) for name in features]
+    else:
+        gain = model.feature_importances_
+        split = np.zeros(len(features), dtype=np.int64)
+        for tree in model.estimators_:
+            used = tree.tree_.feature[tree.tree_.feature >= 0]
+            split += np.bincount(used, minlength=len(features))
+
+    gain = np.asarray(gain, dtype=float)
+    total = gain.sum()
+    if total > 0:
+        gain = gain / total
+
+    items = [
+        {"feature": feature, "gain": float(g), "split": int(s)}
+        for feature, g, s in zip(features, gain, split)
+    ]
+    return sorted(items, key=lambda item: item["gain"], reverse=True)
+
+def _saabas_forest(model, X: pd.DataFrame):
+    """Contribuciones por camino de un bosque, vectorizadas con matrices dispersas."""
+    import scipy.sparse as sp
+
+    positive = list(model.classes_).index(1)
+    n_features = X.shape[1]
+    blocks = []
+    base = 0.0
+
+    for tree in model.estimators_:
+        t = tree.tree_
+        value = t.value[:, 0, :]
+        # Versiones viejas de scikit-learn guardan conteos en lugar de fracciones
+        proba = value[:, positive] / value.sum(axis=1)
+
+        internal = np.nonzero(t.children_left >= 0)[0]
+        children = np.concatenate([t.children_left[internal], t.children_right[internal]])
+        parents = np.concatenate([internal, internal])
+        delta = proba[children] - proba[parents]
+
+        blocks.append(sp.csr_matrix(
+            (delta, (children, t.feature[parents])), shape=(t.node_count, n_features)))
+        base += proba[0]
+
+    # Una sola pasada por todos los árboles: filas x nodos del bosque completo
+    indicator, _ = model.decision_path(X)
+    contributions = np.asarray((indicator @ sp.vstack(blocks).tocsr()).todense())
+
+    n_trees = len(model.estimators_)
+    return contributions / n_trees, base / n_trees
+
+def contributions(model, features_df: pd.DataFrame):
+    """Devuelve ``(contribuciones, base_value)`` para las filas de ``features_df``.
+
+    ``contribuciones`` tiene una columna por característica en el orden de
+    ``model_features``; el espacio de salida lo indica ``EXPLAINERS``.
+    """
+    kind = _model_kind(model)
+    X = features_df[model_features(model)]
+
+    if kind == "LGBMClassifier":
+        raw = np.asarray(model.predict(X, pred_contrib=True), dtype=float)
+        return raw[:, :-1], float(raw[0, -1])
+
+    if kind == "XGBClassifier":
+        import xgboost as xgb
+
+        best_iteration = getattr(model, "best_iteration", None)
+        iteration_range = (0, best_iteration + 1) if best_iteration is not None else (0, 0)
+        raw = model.get_booster().predict(
+            xgb.DMatrix(X), pred_contribs=True, iteration_range=iteration_range)
+        raw = np.asarray(raw, dtype=float)
+        return raw[:, :-1], float(raw[0, -1])
+
+    # Con nombres de columnas, como se entrenó el bosque; scikit-learn avisa si faltan
+    values, base = _saabas_forest(model, X.astype(np.float32))
+    return values, float(base)
+
+def _probability(value: float, output: str) -> float:
+    if output == OUTPUT_LOG_ODDS:
+        return float(1.0 / (1.0 + np.exp(-value)))
+    return float(value)
+
+class ExplanationCache:
+    def __init__(self, max_entries: int = EXPLANATION_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # (path, key) -> (version, contribuciones, base_value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, model_path: str, version, keys: list) -> list:
+        results = []
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get((model_path, key))
+                if entry is not None and entry[0] == version:
+                    self._entries.move_to_end((model_path, key))
+                    self.hits += 1
+                    results.append(entry[1:])
+                else:
+                    self.misses += 1
+                    results.append(None)
+        return results
+
+    def put_many(self, model_path: str, version, keys: list, rows: list, base_value: float):
+        with self._lock:
+            for key, row in zip(keys, rows):
+                self._entries[(model_path, key)] = (version, row, base_value)
+                self._entries.move_to_end((model_path, key))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+EXPLANATION_CACHE = ExplanationCache()
+
+def explain_batch(model_path, features_df: pd.DataFrame):
+    """Explica cada fila de ``features_df``; None si el modelo no existe.
+
+    Solo se calculan las filas que no están en la caché, todas en una llamada.
+    """
+    try:
+        model = load_model(model_path)
+    except FileNotFoundError:
+        print(f"Error: No se encontró el archivo del modelo en '{model_path}'")
+        return None
+
+    method, output = EXPLAINERS[_model_kind(model)]
+    check_feature_order(model)
+
+    version = _artifact_version(model_path)
+    use_cache = EXPLANATION_CACHE.max_entries > 0 and version is not None
+    cache_path = os.path.abspath(model_path)
+
+    keys = row_keys(to_matrix(features_df)) if use_cache else None
+    cached = EXPLANATION_CACHE.get_many(cache_path, version, keys) if use_cache else [None] * len(features_df)
+    missing = [i for i, entry in enumerate(cached) if entry is None]
+
+    if missing:
+        with metrics.stage("explain"), governor.inference(model, len(missing)):
+            values, base_value = contributions(model, features_df.iloc[missing])
+        rows = values.tolist()
+        if use_cache:
+            EXPLANATION_CACHE.put_many(cache_path, version, [keys[i] for i in missing], rows, base_value)
+        for i, row in zip(missing, rows):
+            cached[i] = (row, base_value)
+
+    base_value = cached[0][1] if cached else None
+    explanations = []
+    for row, row_base in cached:
+        value = row_base + sum(row)
+        explanations.append({
+            "value": value,
+            "probability": _probability(value, output),
+            "contributions": row,
+        })
+
+    return {
+        "method": method,
+        "output": output,
+        "features": model_features(model),
+        "base_value": base_value,
+        "explanations": explanations,
+    }
+
+def model_importance(model_path):
+    """Importancia guardada en el artefacto al entrenar; se calcula si el modelo es anterior."""
+    directory = artifact_path(model_path)
+    if os.path.isdir(directory):
+        importance = read_metadata(directory).get("importance")
+        if importance is not None:
+            return importance
+
+    try:
+        return feature_importance(load_model(model_path))
+    except FileNotFoundError:
+        return None
@@ -1,38 +1,79 @@
 import pandas as pd
 import lightgbm as lgb
-from sklearn.model_selection import train_test_split
+from sklearn.model_selection import train_test_split, StratifiedKFold
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.metrics import accuracy_score, classification_report, roc_auc_score, precision_recall_curve, auc
-import matplotlib.pyplot as plt
 import joblib
 from typing import Tuple
 import sys
 import xgboost as xgb
 import os
-
-KOI_FEATURES = [
-    'koi_period',       # Período Orbital
-    'koi_time0bk',      # Época del Tránsito
-    'koi_impact',       # Parámetro de Impacto
-    'koi_duration',     # Duración del Tránsito
-    'koi_depth',        # Profundidad del Tránsito
-    'koi_prad',         # Radio Planetario
-    'koi_teq',          # Temperatura de Equilibrio
-    'koi_insol',        # Flujo de Insolación
-    'koi_model_snr',    # Relación Señal a Ruido del Tránsito
-    'koi_steff',        # Temperatura Estelar Efectiva
-    'koi_srad',         # Radio Estelar
-]
+import json
+import shutil
+import hashlib
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from .artifact import export_artifact
+from .explain import feature_importance
+from .features import FEATURE_NAMES, FEATURE_DTYPE, as_frame, check_feature_order
+from .monitor import TrainingMonitor
+from . import binned
+from .. import metrics, governor
+
+KOI_FEATURES = list(FEATURE_NAMES)
 
 BASE_PATH = os.path.dirname(os.path.dirname(__file__))
 DATA_PATH = os.path.join(BASE_PATH, "data", "raw")
 OUTPUTS_PATH = os.path.join(BASE_PATH, "model", "outputs")
 
-def load_kepler_data() -> Tuple[pd.DataFrame, pd.Series]:
-    filepath = os.path.join(DATA_PATH, 'koi.csv')  # Asegúrate que la ruta es correcta
-    target_column = 'koi_disposition'
-
-    df_raw = pd.read_csv(filepath, skiprows=53)
+KOI_TARGET = 'koi_disposition'
+KOI_SKIPROWS = 53
+
+# Versión del preprocesamiento; súbela si cambia _build_kepler_data
+KOI_DATASET_VERSION = 2
+DATASET_CACHE_PATH = os.path.join(BASE_PATH, "model", "cache", "datasets")
+
+_file_hashes = {}
+
+def _hash_file(filepath: str) -> str:
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _file_sha256(filepath: str) -> str:
+    """SHA-256 del archivo, memorizado por (ruta, mtime, tamaño)."""
+    stat = os.stat(filepath)
+    key = (os.path.abspath(filepath), stat.st_mtime_ns, stat.st_size)
+    if key not in _file_hashes:
+        _file_hashes[key] = _hash_file(filepath)
+    return _file_hashes[key]
+
+def kepler_dataset_key(filepath: str = None) -> str:
+    """Identifica el dataset limpio: contenido del CSV + configuración de filtrado."""
+    filepath = filepath or os.path.join(DATA_PATH, 'koi.csv')
+    config = {
+        'source': _file_sha256(filepath),
+        'features': KOI_FEATURES,
+        'target': KOI_TARGET,
+        'skiprows': KOI_SKIPROWS,
+        'fp_flags': ['koi_fpflag_nt', 'koi_fpflag_ss'],
+        'version': KOI_DATASET_VERSION,
+    }
+    return hashlib.sha256(json.dumps(config, sort_keys=True).encode()).hexdigest()
+
+def dataset_cache_dir(filepath: str = None) -> str:
+    """Directorio de la caché del dataset limpio; cambia con ``kepler_dataset_key``."""
+    filepath = filepath or os.path.join(DATA_PATH, 'koi.csv')
+    return os.path.join(DATASET_CACHE_PATH, f"koi_{kepler_dataset_key(filepath)[:16]}")
+
+def _build_kepler_data(filepath: str) -> Tuple[np.ndarray, np.ndarray]:
+    target_column = KOI_TARGET
+
+    df_raw = pd.read_csv(filepath, skiprows=KOI_SKIPROWS)
     # 1. Separa los datos por su disposición original.
     confirmed_and_candidates = df_raw[df_raw[target_column].isin(['CONFIRMED', 'CANDIDATE'])]
     false_positives = df_raw[df_raw[target_column] == 'FALSE POSITIVE']
@@ -44,31 +85,250 @@ def load_kepler_data() -> Tuple[pd.DataFrame, pd.Series]:
 
     # 3. Vuelve a unir los DataFrames: los confirmados/candidatos + los FP filtrados.
     df_filtered = pd.concat([confirmed_and_candidates, filtered_false_positives])
-    '''
-    df_filtered = df_raw[df_raw[target_column].isin(['CONFIRMED', 'FALSE POSITIVE', 'CANDIDATE'])]
 
+    # 4. Imputa con la mediana de cada columna; float32 como en el servicio
+    features = df_filtered[KOI_FEATURES]
+    X = features.fillna(features.median()).to_numpy(dtype=FEATURE_DTYPE)
 
-    print(df_filtered.head())
-'''
-    df_clean = df_filtered[KOI_FEATURES + [target_column]].copy()
+    y = df_filtered[target_column].isin(['CONFIRMED', 'CANDIDATE']).to_numpy(dtype=np.int64)
 
-    for col in KOI_FEATURES:
-        df_clean[col].fillna(df_clean[col].median(), inplace=True)
+    return np.ascontiguousarray(X), y
 
-    X = df_clean[KOI_FEATURES]
+def load_kepler_data(use_cache: bool = True) -> Tuple[pd.DataFrame, pd.Series]:
+    """Carga el dataset KOI limpio.
 
-    y = df_clean[target_column].apply(lambda x: 1 if x in ['CONFIRMED', 'CANDIDATE'] else 0)
-    
-    return X, y
+    La primera vez se materializa en ``DATASET_CACHE_PATH`` como arreglos ``.npy``;
+    las siguientes llamadas los abren con ``mmap_mode`` sin volver a leer el CSV.
+    """
+    filepath = os.path.join(DATA_PATH, 'koi.csv')  # Asegúrate que la ruta es correcta
+
+    if not use_cache:
+        X, y = _build_kepler_data(filepath)
+    else:
+        cache_dir = dataset_cache_dir(filepath)
+
+        if not os.path.isdir(cache_dir):
+            X, y = _build_kepler_data(filepath)
+            # Escritura atómica: otro proceso puede estar construyendo la misma caché
+            os.makedirs(DATASET_CACHE_PATH, exist_ok=True)
+            tmp_dir = tempfile.mkdtemp(dir=DATASET_CACHE_PATH)
+            np.save(os.path.join(tmp_dir, 'X.npy'), X)
+            np.save(os.path.join(tmp_dir, 'y.npy'), y)
+            try:
+                os.rename(tmp_dir, cache_dir)
+            except OSError:
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+
+        X = np.load(os.path.join(cache_dir, 'X.npy'), mmap_mode='r')
+        y = np.load(os.path.join(cache_dir, 'y.npy'), mmap_mode='r')
+
+    return as_frame(X), pd.Series(y, name=KOI_TARGET, copy=False)
+
+def save_compiled_model(model, model_path: str, X_test: pd.DataFrame, metadata: dict = None):
+    """Exporta el artefacto mapeable del modelo; si falla, el .joblib sigue sirviendo.
+
+    La importancia de las características se guarda en sus metadatos para que
+    /api/importance no tenga que cargar el modelo.
+    """
+    metadata = {**(metadata or {}), "importance": feature_importance(model)}
+    try:
+        export_artifact(model, model_path, X_test, metadata)
+    except ValueError as e:
+        print(f"No se pudo compilar el modelo: {e}")
+
+# Opciones de entrenamiento del request que no son hiperparámetros del estimador
+TRAINING_OPTIONS = ("early_stopping_rounds", "time_budget_seconds", "cv_folds")
+BOOSTED_MODELS = ("light_gbm", "xgboost")
+
+# Fracción del conjunto de entrenamiento que se reserva para decidir cuándo parar
+VALIDATION_FRACTION = 0.10
+
+def split_training_options(params: dict) -> Tuple[dict, dict]:
+    """Separa los hiperparámetros del estimador de las opciones de entrenamiento."""
+    params = {k: v for k, v in params.items() if v is not None and k != "model_type"}
+    options = {k: params.pop(k) for k in TRAINING_OPTIONS if k in params}
+    return params, options
+
+def build_monitor(model_type: str, options: dict, on_iteration=None):
+    """Monitor por iteración para los modelos boosted, o None si no hace falta.
+
+    Solo ``early_stopping_rounds`` y ``time_budget_seconds`` lo activan entre las
+    opciones; ``cv_folds`` no sigue las iteraciones.
+    """
+    truncates = options.get("early_stopping_rounds") is not None or options.get("time_budget_seconds") is not None
+    if model_type not in BOOSTED_MODELS or not (truncates or on_iteration):
+        return None
+    return TrainingMonitor(
+        patience=options.get("early_stopping_rounds"),
+        time_budget=options.get("time_budget_seconds"),
+        on_iteration=on_iteration,
+    )
 
-def use_light_gbm_model(X: pd.DataFrame, y: pd.Series, model_params: dict = None) -> Tuple[str, float, float, float]:
+def validation_split(X_train, y_train, monitor: TrainingMonitor, X_test=None, y_test=None):
+    """``(X_train, X_val, y_train, y_val)`` con los que se sigue cada iteración.
+
+    Con early stopping o límite de tiempo se valida sobre una parte del
+    entrenamiento (el conjunto de prueba solo se usa para las métricas finales).
+    Si solo se sigue el progreso el modelo no cambia: se valida sobre ``X_test``
+    o, sin conjunto de prueba, sobre las mismas filas de entrenamiento.
+    """
+    if monitor.truncates:
+        return train_test_split(
+            X_train, y_train, test_size=VALIDATION_FRACTION, random_state=42, stratify=y_train
+        )
+    if X_test is None:
+        return X_train, X_train, y_train, y_train
+    return X_train, X_test, y_train, y_test
+
+def report_stop(monitor: TrainingMonitor):
+    summary = monitor.summary()
+    if summary["stopped"]:
+        print(f"Entrenamiento detenido por {summary['stopped']} en la iteración {summary['iterations']} "
+              f"(mejor iteración {summary['best_iteration']}, AUC {summary['best_auc']:.4f})")
+
+def fit_with_monitor(model, X_train, y_train, monitor: TrainingMonitor, X_test=None, y_test=None):
+    """Entrena evaluando cada iteración; la validación la elige ``validation_split``."""
+    X_train, X_val, y_train, y_val = validation_split(X_train, y_train, monitor, X_test, y_test)
+
+    if isinstance(model, lgb.LGBMClassifier):
+        model.fit(
+            X_train, y_train,
+            eval_set=[(X_val, y_val)],
+            eval_metric=["auc", "binary_logloss"],
+            callbacks=[monitor.lightgbm_callback()],
+        )
+    else:
+        model.set_params(eval_metric=["logloss", "auc"], callbacks=[monitor.xgboost_callback()])
+        try:
+            model.fit(X_train, y_train, eval_set=[(X_val, y_val)])
+        finally:
+            # El callback no debe guardarse con el modelo; set_params reconfiguraría el booster
+            model.callbacks = None
+
+    report_stop(monitor)
+    return model
+
+def _monitored_split(split: str, monitor: TrainingMonitor, X_test) -> str:
+    """Nombre de la partición que entrena cuando ``validation_split`` separa una validación."""
+    if monitor is not None and monitor.truncates:
+        return f"{split}_fit_{VALIDATION_FRACTION}"
+    return split
+
+def train_xgboost(model: xgb.XGBClassifier, split: str, X_train, y_train,
+                  monitor: TrainingMonitor = None, X_test=None, y_test=None) -> xgb.XGBClassifier:
+    """Entrena ``model`` sobre la ``QuantileDMatrix`` en caché de la partición ``split``.
+
+    Equivale a ``model.fit`` (mismos parámetros y mismos árboles) sin volver a
+    calcular los cuantiles; el booster se carga en ``model`` al terminar.
+    """
+    params = model.get_xgb_params()
+    evals = []
+    callbacks = None
+
+    if monitor is not None:
+        split = _monitored_split(split, monitor, X_test)
+        X_train, X_val, y_train, y_val = validation_split(X_train, y_train, monitor, X_test, y_test)
+        dtrain, dval = binned.xgboost_matrices(dataset_cache_dir(), split, X_train, y_train, X_val, y_val, params)
+        params["eval_metric"] = ["logloss", "auc"]
+        evals = [(dval, "validation_0")]
+        callbacks = [monitor.xgboost_callback()]
+    else:
+        dtrain, _ = binned.xgboost_matrices(dataset_cache_dir(), split, X_train, y_train, params=params)
+
+    booster = xgb.train(
+        params, dtrain,
+        num_boost_round=model.n_estimators or 100,
+        evals=evals,
+        callbacks=callbacks,
+        verbose_eval=False,
+    )
+    model.load_model(bytearray(booster.save_raw("ubj")))
+
+    if monitor is not None:
+        report_stop(monitor)
+    return model
+
+def train_lightgbm_booster(params: dict, split: str, X_train, y_train,
+                           monitor: TrainingMonitor = None) -> lgb.Booster:
+    """Booster nativo de LightGBM entrenado sobre el ``Dataset`` binado en caché.
+
+    Da los mismos árboles que ``LGBMClassifier(**params).fit``; sirve para evaluar
+    hiperparámetros, ya que el wrapper de scikit-learn no acepta un ``Dataset``
+    construido de antemano.
+    """
+    params = {"verbose": -1, **params, "objective": "binary"}
+    num_boost_round = params.pop("n_estimators", None) or 100
+    valid_sets = None
+    callbacks = None
+
+    if monitor is not None:
+        split = _monitored_split(split, monitor, None)
+        X_train, X_val, y_train, y_val = validation_split(X_train, y_train, monitor)
+        dtrain = binned.lightgbm_dataset(dataset_cache_dir(), split, X_train, y_train, params)
+        valid_sets = [lgb.Dataset(X_val, y_val, reference=dtrain)]
+        params["metric"] = ["auc", "binary_logloss"]
+        callbacks = [monitor.lightgbm_callback()]
+    else:
+        dtrain = binned.lightgbm_dataset(dataset_cache_dir(), split, X_train, y_train, params)
+
+    booster = lgb.train(params, dtrain, num_boost_round=num_boost_round, valid_sets=valid_sets, callbacks=callbacks)
+    if monitor is not None:
+        report_stop(monitor)
+    return booster
+
+MODEL_FILENAME_PREFIX = "exoplanet_kepler_model_"
+
+def save_model(model) -> Tuple[str, str]:
+    """Guarda el modelo en OUTPUTS_PATH con un nombre derivado de su contenido.
+
+    Se escribe primero a un archivo temporal y se renombra de forma atómica, así
+    dos entrenamientos simultáneos nunca se pisan. Si ya existe un artefacto con
+    los mismos bytes se reutiliza. Devuelve ``(nombre, ruta)``.
+    """
+    # El servicio arma las entradas en el orden de KOI_FEATURES; no se guarda otro
+    check_feature_order(model)
+
+    os.makedirs(OUTPUTS_PATH, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=OUTPUTS_PATH, prefix=".tmp-", suffix=".joblib")
+    os.close(fd)
+
+    try:
+        joblib.dump(model, tmp_path)
+        model_filename = f"{MODEL_FILENAME_PREFIX}{_hash_file(tmp_path)[:16]}.joblib"
+        model_path = os.path.join(OUTPUTS_PATH, model_filename)
+        if os.path.exists(model_path):
+            os.remove(tmp_path)
+        else:
+            os.replace(tmp_path, model_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    return model_filename, model_path
+
+def artifact_metadata(model_type: str, model_params: dict, accuracy: float, roc_auc: float, pr_auc: float) -> dict:
+    return {
+        "model_type": model_type,
+        "params": model_params,
+        "metrics": {"accuracy": accuracy, "roc_auc": roc_auc, "pr_auc": pr_auc},
+    }
+
+def use_light_gbm_model(X: pd.DataFrame, y: pd.Series, model_params: dict = None,
+                        monitor: TrainingMonitor = None) -> Tuple[str, float, float, float]:
+    timer = metrics.PhaseTimer("light_gbm")
     X_train, X_test, y_train, y_test = train_test_split(
         X, y, test_size=0.20, random_state=42, stratify=y
     )
+    timer.mark("split")
 
     model = lgb.LGBMClassifier(**model_params)
 
-    model.fit(X_train, y_train)
+    if monitor is None:
+        model.fit(X_train, y_train)
+    else:
+        fit_with_monitor(model, X_train, y_train, monitor, X_test, y_test)
+    timer.mark("fit")
     print("¡Entrenamiento completo!")
     
     # 3. Hacer predicciones y evaluar
@@ -88,37 +348,30 @@ def use_light_gbm_model(X: pd.DataFrame, y: pd.Series, model_params: dict = None
 
     print(f"ROC-AUC: {roc_auc:.3f}")
     print(f"PR-AUC: {pr_auc:.3f}")
+    timer.mark("evaluate")
     
     # 4. Guardar el modelo entrenado para uso futuro
 
-    outputs = os.listdir(OUTPUTS_PATH)
-
-    if len(outputs) == 0:
-        model_filename = 'exoplanet_kepler_model.joblib'
-    else:
-        model_filename = f"exoplanet_kepler_model_v{len(outputs)+1}.joblib"
-
-    model_path = os.path.join(OUTPUTS_PATH, model_filename)
-    joblib.dump(model, model_path)
+    model_filename, model_path = save_model(model)
     print(f"\nModelo guardado exitosamente como '{model_filename}'")
-    
-    '''# 5. Visualizar la importancia de las características
-    lgb.plot_importance(model, max_num_features=11, figsize=(10, 8), 
-                        title='Importancia de las Características (LightGBM)')
-    plt.tight_layout()
-    plt.savefig('feature_importance_kepler.png')
-    print("Gráfico de importancia de características guardado como 'feature_importance_kepler.png'")'''
+    save_compiled_model(model, model_path, X_test, artifact_metadata("light_gbm", model_params, accuracy, roc_auc, pr_auc))
+    timer.mark("save")
 
     return model_filename, accuracy, roc_auc, pr_auc
 
-def use_xg_boost_model(X: pd.DataFrame, y: pd.Series, model_params: dict = None) -> Tuple[str, float, float, float]:
+def use_xg_boost_model(X: pd.DataFrame, y: pd.Series, model_params: dict = None,
+                       monitor: TrainingMonitor = None) -> Tuple[str, float, float, float]:
+    timer = metrics.PhaseTimer("xgboost")
     X_train, X_test, y_train, y_test = train_test_split(
         X, y, test_size=0.25, random_state=42, stratify=y
     )
+    timer.mark("split")
 
     model = xgb.XGBClassifier(**model_params)
 
-    model.fit(X_train, y_train, eval_set=[(X_test, y_test)])
+    # Los cuantiles de la partición se calculan una vez y se reutilizan entre pruebas
+    train_xgboost(model, f"train_{TEST_SIZES['xgboost']}", X_train, y_train, monitor, X_test, y_test)
+    timer.mark("fit")
 
     y_pred = model.predict(X_test)
     y_proba = model.predict_proba(X_test)[:,1]
@@ -131,29 +384,25 @@ def use_xg_boost_model(X: pd.DataFrame, y: pd.Series, model_params: dict = None)
 
     print("ROC-AUC:", roc_auc_score(y_test, y_proba))
     print("\nReporte de clasificación:\n", classification_report(y_test, y_pred))
+    timer.mark("evaluate")
 
-    # 5. Visualizar la importancia de las características
-    outputs = os.listdir(OUTPUTS_PATH)
-
-    if len(outputs) == 0:
-        model_filename = 'exoplanet_kepler_model_xgb.joblib'
-    else:
-        model_filename = f"exoplanet_kepler_model_v{len(outputs)+1}.joblib"
-
-    model_path = os.path.join(OUTPUTS_PATH, model_filename)
-    joblib.dump(model, model_path)
+    model_filename, model_path = save_model(model)
     print(f"\nModelo guardado exitosamente como '{model_filename}'")
+    save_compiled_model(model, model_path, X_test, artifact_metadata("xgboost", model_params, accuracy, roc_auc, pr_auc))
+    timer.mark("save")
 
     return model_filename, accuracy, roc_auc, pr_auc 
 
 def use_randomforest_model(X: pd.DataFrame, y: pd.Series, model_params: dict = None) -> Tuple[str, float, float, float]:
+    timer = metrics.PhaseTimer("random_forest")
     X_train, X_test, y_train, y_test = train_test_split(
         X, y, test_size=0.25, random_state=42, stratify=y
     )
-    # n_jobs=-1 usa todos los núcleos de tu CPU para acelerar el entrenamiento
+    timer.mark("split")
     model = RandomForestClassifier(**model_params)
 
     model.fit(X_train, y_train)
+    timer.mark("fit")
 
     y_pred = model.predict(X_test)
 
@@ -172,36 +421,318 @@ def use_randomforest_model(X: pd.DataFrame, y: pd.Series, model_params: dict = N
 
     print(f"ROC-AUC: {roc_auc:.3f}")
     print(f"PR-AUC: {pr_auc:.3f}") 
+    timer.mark("evaluate")
 
-    outputs = os.listdir(OUTPUTS_PATH)
-
-    if len(outputs) == 0:
-        model_filename = 'exoplanet_kepler_model_randomforest.joblib'
-    else:
-        model_filename = f"exoplanet_kepler_model_v{len(outputs)+1}.joblib"
-
-    model_path = os.path.join(OUTPUTS_PATH, model_filename)
-
-    joblib.dump(model, model_path)
+    model_filename, model_path = save_model(model)
 
     print(f"\nModelo guardado exitosamente como '{model_filename}'") 
+    save_compiled_model(model, model_path, X_test, artifact_metadata("random_forest", model_params, accuracy, roc_auc, pr_auc))
+    timer.mark("save")
 
     return model_filename, accuracy, roc_auc, pr_auc
 
-def train_and_evaluate_model(model_type: str = "light_gbm", params: dict = None):
+def train_and_evaluate_model(model_type: str = "light_gbm", params: dict = None, on_iteration=None):
+    """Entrena y guarda un modelo; devuelve ``(nombre, accuracy, roc_auc, pr_auc, cv)``.
+
+    ``on_iteration`` recibe un dict por iteración (AUC/logloss de validación) en
+    los modelos boosted; ``early_stopping_rounds`` y ``time_budget_seconds`` en
+    ``params`` activan la parada anticipada. Con ``cv_folds`` las métricas son la
+    media de la validación cruzada y ``cv`` trae su desviación estándar; si no,
+    ``cv`` es None.
+    """
+    timer = metrics.PhaseTimer(model_type)
     X, y = load_kepler_data()
+    timer.mark("load_data")
 
-    params = {k: v for k, v in params.items() if v is not None}
-    
+    # model_type viene del request y no es un hiperparámetro del estimador
+    params, options = split_training_options(params)
+    monitor = build_monitor(model_type, options, on_iteration)
+
+    # n_jobs sale del presupuesto de entrenamiento para no quitarle núcleos a la inferencia
+    with governor.training_slot() as threads:
+        params = governor.training_params(params, threads)
+
+        if "cv_folds" in options:
+            return use_cross_validation(X, y, model_type, params, options, threads, monitor)
+        elif model_type == "light_gbm":
+            result = use_light_gbm_model(X, y, model_params=params, monitor=monitor)
+        elif model_type == "xgboost":
+            result = use_xg_boost_model(X, y, model_params=params, monitor=monitor)
+        elif model_type == "random_forest":
+            result = use_randomforest_model(X, y, model_params = params)
+        else:
+            raise ValueError("Modelo no soportado. Usa 'light_gbm', 'xgboost' o 'random_forest'.")
+
+    return (*result, None)
+
+# Tamaño del conjunto de prueba que usa cada use_*_model
+TEST_SIZES = {"light_gbm": 0.20, "xgboost": 0.25, "random_forest": 0.25}
+
+def build_estimator(model_type: str, params: dict):
     if model_type == "light_gbm":
-        return use_light_gbm_model(X, y, model_params=params)
+        return lgb.LGBMClassifier(**params)
     elif model_type == "xgboost":
-        return use_xg_boost_model(X, y, model_params=params)
+        return xgb.XGBClassifier(**params)
     elif model_type == "random_forest":
-        return use_randomforest_model(X, y, model_params = params)
+        return RandomForestClassifier(**params)
     else:
         raise ValueError("Modelo no soportado. Usa 'light_gbm', 'xgboost' o 'random_forest'.")
 
+def evaluate_params(model_type: str, params: dict, data_fraction: float = 1.0) -> dict:
+    """Entrena sin guardar el modelo y devuelve sus métricas sobre el conjunto de prueba.
+
+    Usa la misma partición que ``use_*_model``; con ``data_fraction < 1`` solo se
+    entrena con una muestra estratificada del conjunto de entrenamiento.
+    """
+    X, y = load_kepler_data()
+    params, options = split_training_options(params)
+    monitor = build_monitor(model_type, options)
+
+    X_train, X_test, y_train, y_test = train_test_split(
+        X, y, test_size=TEST_SIZES[model_type], random_state=42, stratify=y
+    )
+    if data_fraction < 1.0:
+        X_train, _, y_train, _ = train_test_split(
+            X_train, y_train, train_size=data_fraction, random_state=42, stratify=y_train
+        )
+
+    split = f"train_{TEST_SIZES[model_type]}"
+    if data_fraction < 1.0:
+        split = f"{split}_fraction_{data_fraction}"
+
+    with governor.training_slot() as threads:
+        params = governor.training_params(params, threads)
+        if model_type == "light_gbm":
+            booster = train_lightgbm_booster(params, split, X_train, y_train, monitor)
+            accuracy, roc_auc, pr_auc = proba_metrics(y_test, booster.predict(X_test))
+            return {"accuracy": accuracy, "roc_auc": roc_auc, "pr_auc": pr_auc}
+
+        model = build_estimator(model_type, params)
+        if model_type == "xgboost":
+            train_xgboost(model, split, X_train, y_train, monitor)
+        elif monitor is None:
+            model.fit(X_train, y_train)
+        else:
+            fit_with_monitor(model, X_train, y_train, monitor)
+
+    accuracy, roc_auc, pr_auc = test_metrics(model, X_test, y_test)
+    return {"accuracy": accuracy, "roc_auc": roc_auc, "pr_auc": pr_auc}
+
+def proba_metrics(y_test, y_proba) -> Tuple[float, float, float]:
+    """``(accuracy, roc_auc, pr_auc)`` a partir de la probabilidad de la clase positiva."""
+    precision, recall, _ = precision_recall_curve(y_test, y_proba)
+    return accuracy_score(y_test, y_proba > 0.5), roc_auc_score(y_test, y_proba), auc(recall, precision)
+
+def test_metrics(model, X_test, y_test) -> Tuple[float, float, float]:
+    """``(accuracy, roc_auc, pr_auc)`` del modelo sobre el conjunto de prueba."""
+    return proba_metrics(y_test, model.predict_proba(X_test)[:, 1])
+
+def n_trees(model) -> int:
+    """Árboles que usa el modelo al predecir."""
+    if isinstance(model, lgb.LGBMClassifier):
+        return model.booster_.num_trees()
+    if isinstance(model, xgb.XGBClassifier):
+        return model.get_booster().num_boosted_rounds()
+    return len(model.estimators_)
+
+def extend_estimator(parent, model_type: str, n_estimators: int, X_train, y_train,
+                     n_jobs: int, learning_rate: float = None):
+    """Agrega ``n_estimators`` árboles a ``parent`` entrenados sobre ``X_train``.
+
+    LightGBM y XGBoost parten de la salida del booster guardado (``init_model`` /
+    ``xgb_model``), cortado en su mejor iteración si tuvo early stopping. Random
+    Forest conserva sus árboles y agrega los nuevos con ``warm_start``.
+    """
+    if model_type == "light_gbm":
+        # model_to_string guarda hasta best_iteration cuando existe
+        init_model = lgb.Booster(model_str=parent.booster_.model_to_string())
+        params = {**parent.get_params(), "n_estimators": n_estimators, "n_jobs": n_jobs}
+        if learning_rate is not None:
+            params["learning_rate"] = learning_rate
+        return lgb.LGBMClassifier(**params).fit(X_train, y_train, init_model=init_model)
+
+    if model_type == "xgboost":
+        booster = parent.get_booster()
+        best_iteration = getattr(parent, "best_iteration", None)
+        if best_iteration is not None:
+            booster = booster[:best_iteration + 1]
+        params = {
+            **parent.get_params(),
+            "n_estimators": n_estimators,
+            "n_jobs": n_jobs,
+            "early_stopping_rounds": None,
+            "callbacks": None,
+        }
+        if learning_rate is not None:
+            params["learning_rate"] = learning_rate
+        return xgb.XGBClassifier(**params).fit(X_train, y_train, xgb_model=booster)
+
+    if model_type == "random_forest":
+        parent.set_params(warm_start=True, n_estimators=len(parent.estimators_) + n_estimators, n_jobs=n_jobs)
+        # Copia escribible: el bosque no acepta la vista de solo lectura del dataset en caché
+        parent.fit(as_frame(np.array(X_train, dtype=FEATURE_DTYPE)), y_train)
+        parent.set_params(warm_start=False)
+        return parent
+
+    raise ValueError("Modelo no soportado. Usa 'light_gbm', 'xgboost' o 'random_forest'.")
+
+def continue_training(model_path: str, model_type: str, n_estimators: int,
+                      X_delta: np.ndarray = None, y_delta: np.ndarray = None,
+                      learning_rate: float = None) -> Tuple[str, float, float, float, int]:
+    """Continúa el entrenamiento de un modelo guardado y guarda el resultado como un modelo nuevo.
+
+    Los árboles nuevos se entrenan con la partición de entrenamiento de KOI más
+    las filas nuevas (``X_delta``, ``y_delta``); las filas nuevas nunca entran en
+    la prueba, así las métricas se comparan con las del modelo padre. Por eso el
+    padre debe haberse entrenado con una sola partición, no con ``cv_folds``. Devuelve
+    ``(nombre, accuracy, roc_auc, pr_auc, árboles totales)``.
+    """
+    timer = metrics.PhaseTimer(model_type)
+    parent = joblib.load(model_path)
+    check_feature_order(parent)
+    X, y = load_kepler_data()
+    timer.mark("load_data")
+
+    X_train, X_test, y_train, y_test = train_test_split(
+        X, y, test_size=TEST_SIZES[model_type], random_state=42, stratify=y
+    )
+    if X_delta is not None and len(X_delta):
+        # Los valores faltantes de las filas nuevas se imputan con la mediana de
+        # cada columna, como el resto del dataset (imputar con la mediana no la cambia)
+        X_delta = X_delta.astype(FEATURE_DTYPE)
+        X_delta = np.where(np.isnan(X_delta), X.median().to_numpy(dtype=FEATURE_DTYPE), X_delta)
+        X_train = as_frame(np.concatenate([X_train.to_numpy(dtype=FEATURE_DTYPE), X_delta]))
+        y_train = pd.Series(np.concatenate([y_train.to_numpy(), y_delta]), name=KOI_TARGET)
+    timer.mark("split")
+
+    with governor.training_slot() as threads:
+        model = extend_estimator(parent, model_type, n_estimators, X_train, y_train, threads, learning_rate)
+    timer.mark("fit")
+
+    accuracy, roc_auc, pr_auc = test_metrics(model, X_test, y_test)
+    print(f"Continuación de '{os.path.basename(model_path)}': {n_trees(model)} árboles, "
+          f"ROC-AUC {roc_auc:.3f}, PR-AUC {pr_auc:.3f}")
+    timer.mark("evaluate")
+
+    model_filename, saved_path = save_model(model)
+    print(f"\nModelo guardado exitosamente como '{model_filename}'")
+    params = {"n_estimators": n_estimators, "learning_rate": learning_rate, "rows": 0 if X_delta is None else len(X_delta)}
+    metadata = artifact_metadata(model_type, params, accuracy, roc_auc, pr_auc)
+    metadata["parent"] = os.path.basename(model_path)
+    save_compiled_model(model, saved_path, X_test, metadata)
+    timer.mark("save")
+
+    return model_filename, accuracy, roc_auc, pr_auc, n_trees(model)
+
+# Semilla de los folds; fija para que todos los modelos se comparen con las mismas particiones
+CV_SEED = 42
+
+def fold_indices(n_folds: int) -> np.ndarray:
+    """Fold de prueba de cada fila del dataset KOI con ``StratifiedKFold``.
+
+    Se calcula una sola vez por hash del dataset y se guarda en su caché, así
+    todos los entrenamientos y los procesos de cada fold usan las mismas filas.
+    """
+    _, y = load_kepler_data()
+    cache_dir = dataset_cache_dir()
+    path = os.path.join(cache_dir, f"folds_{n_folds}_{CV_SEED}.npy")
+
+    if not os.path.exists(path):
+        folds = np.empty(len(y), dtype=np.int8)
+        splitter = StratifiedKFold(n_splits=n_folds, shuffle=True, random_state=CV_SEED)
+        for fold, (_, test_index) in enumerate(splitter.split(np.zeros(len(y)), y)):
+            folds[test_index] = fold
+
+        fd, tmp_path = tempfile.mkstemp(dir=cache_dir, prefix=".tmp-", suffix=".npy")
+        os.close(fd)
+        np.save(tmp_path, folds)
+        os.replace(tmp_path, path)
+
+    return np.load(path)
+
+def evaluate_fold(model_type: str, params: dict, options: dict, fold: int, n_folds: int) -> dict:
+    """Entrena con todos los folds menos ``fold`` y devuelve las métricas sobre ``fold``.
+
+    Corre en un proceso del pool de ``use_cross_validation``; ``params`` ya trae
+    su ``n_jobs``.
+    """
+    X, y = load_kepler_data()
+    test = fold_indices(n_folds) == fold
+    split = f"cv_{n_folds}_{CV_SEED}_{fold}"
+    monitor = build_monitor(model_type, options)
+
+    if model_type == "light_gbm":
+        booster = train_lightgbm_booster(params, split, X[~test], y[~test], monitor)
+        accuracy, roc_auc, pr_auc = proba_metrics(y[test], booster.predict(X[test]))
+        return {"accuracy": accuracy, "roc_auc": roc_auc, "pr_auc": pr_auc}
+
+    model = build_estimator(model_type, params)
+    if model_type == "xgboost":
+        train_xgboost(model, split, X[~test], y[~test], monitor)
+    elif monitor is None:
+        model.fit(X[~test], y[~test])
+    else:
+        fit_with_monitor(model, X[~test], y[~test], monitor)
+
+    accuracy, roc_auc, pr_auc = test_metrics(model, X[test], y[test])
+    return {"accuracy": accuracy, "roc_auc": roc_auc, "pr_auc": pr_auc}
+
+def use_cross_validation(X: pd.DataFrame, y: pd.Series, model_type: str, model_params: dict,
+                         options: dict, threads: int, monitor: TrainingMonitor = None):
+    """Valida con ``cv_folds`` folds estratificados en paralelo y guarda el modelo entrenado con todo el dataset.
+
+    Los folds reparten entre sí los ``threads`` del entrenamiento: corren tantos
+    procesos como quepan con al menos un hilo cada uno. Las métricas guardadas
+    son la media de los folds; ``cv`` trae su desviación estándar y cada fold.
+    Con early stopping o límite de tiempo el modelo final deja fuera la parte de
+    validación que elige ``validation_split`` para decidir dónde parar.
+    """
+    timer = metrics.PhaseTimer(model_type)
+    n_folds = options["cv_folds"]
+    fold_indices(n_folds)
+    timer.mark("split")
+
+    workers = max(1, min(n_folds, threads))
+    fold_params = {**model_params, "n_jobs": max(1, threads // workers)}
+    fold_options = {k: v for k, v in options.items() if k != "cv_folds"}
+
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+        futures = [
+            executor.submit(evaluate_fold, model_type, fold_params, fold_options, fold, n_folds)
+            for fold in range(n_folds)
+        ]
+        folds = [future.result() for future in futures]
+    timer.mark("cross_validate")
+
+    summary = {name: [fold[name] for fold in folds] for name in ("accuracy", "roc_auc", "pr_auc")}
+    accuracy, roc_auc, pr_auc = (float(np.mean(summary[name])) for name in ("accuracy", "roc_auc", "pr_auc"))
+    cv = {
+        "folds": n_folds,
+        "accuracy_std": float(np.std(summary["accuracy"])),
+        "roc_auc_std": float(np.std(summary["roc_auc"])),
+        "pr_auc_std": float(np.std(summary["pr_auc"])),
+        "fold_metrics": folds,
+    }
+    print(f"Validación cruzada ({n_folds} folds): ROC-AUC {roc_auc:.3f} ± {cv['roc_auc_std']:.3f}, "
+          f"PR-AUC {pr_auc:.3f} ± {cv['pr_auc_std']:.3f}, precisión {accuracy * 100:.2f}%")
+
+    # El modelo final usa todas las filas (salvo la validación de la parada
+    # anticipada); sus métricas son las de la validación cruzada
+    model = build_estimator(model_type, model_params)
+    if monitor is None:
+        model.fit(X, y)
+    else:
+        fit_with_monitor(model, X, y, monitor)
+    timer.mark("fit")
+
+    model_filename, model_path = save_model(model)
+    print(f"\nModelo guardado exitosamente como '{model_filename}'")
+    metadata = artifact_metadata(model_type, model_params, accuracy, roc_auc, pr_auc)
+    metadata["cv"] = cv
+    save_compiled_model(model, model_path, X[fold_indices(n_folds) == 0], metadata)
+    timer.mark("save")
+
+    return model_filename, accuracy, roc_auc, pr_auc, cv
 
 def main():
     """Función principal para entrenar y evaluar el modelo.""" 
@@ -220,7 +751,6 @@ def main():
             feature_fraction=0.8,
             lambda_l1=0.1,
             lambda_l2=0.1,
-            n_jobs=-1
         )
     elif model_to_use == "xgboost":
         params = dict(
@@ -234,7 +764,6 @@ def main():
             reg_lambda=1.0,
             reg_alpha=0.1,
             random_state=42,
-            n_jobs=-1
         )
     elif model_to_use == "random_forest":
         params = dict(
@@ -242,7 +771,6 @@ def main():
             max_depth=15,
             min_samples_leaf=5,
             random_state=42,
-            n_jobs=-1
         )
 
     train_and_evaluate_model(model_type=model_to_use, params=params)
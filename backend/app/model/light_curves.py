@@ -0,0 +1,224 @@
+"""Curvas de luz sintéticas de un tránsito, igual que ``frontend/src/graphs/curves.ts``.
+
+La forma es un trapecio: fondo plano de profundidad ``koi_depth`` y rampas de
+entrada y salida que se alargan con el parámetro de impacto. El ruido gaussiano
+sigue ``sigmaFromSNR``: la sigma por punto con la que el tránsito completo
+tendría la relación señal a ruido ``koi_model_snr``.
+
+Todo un lote se calcula con operaciones de NumPy sobre una matriz
+(curvas x puntos). Cada curva se guarda en una caché LRU por su tupla de
+parámetros; el ruido sale de un generador sembrado con esa misma tupla, así una
+curva es idéntica se pida sola o dentro de un lote.
+"""
+import os
+import math
+import struct
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+
+# Puntos máximos por curva (puntos por período x períodos) antes de reducir
+LIGHT_CURVE_MAX_POINTS = int(os.environ.get("LIGHT_CURVE_MAX_POINTS", 2_000_000))
+
+# Puntos máximos de todas las curvas de una petición (curvas x puntos por curva)
+LIGHT_CURVE_MAX_REQUEST_POINTS = int(os.environ.get("LIGHT_CURVE_MAX_REQUEST_POINTS", 10_000_000))
+
+# Memoria máxima de las curvas guardadas; 0 desactiva la caché
+LIGHT_CURVE_CACHE_MAX_BYTES = int(os.environ.get("LIGHT_CURVE_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+
+# Valores por defecto de sigmaFromSNR
+CADENCE_MINUTES = 30
+OBS_DAYS = 1320
+DUTY_CYCLE = 0.9
+
+CURVE_DTYPE = np.float32
+
+# Puntos que se generan a la vez (curvas x puntos) al calcular un lote
+CHUNK_ELEMENTS = 1 << 21
+
+def sigma_from_snr(depth_ppm, snr, duration_hours, period_days,
+                   cadence_minutes: float = CADENCE_MINUTES, obs_days: float = OBS_DAYS,
+                   duty_cycle: float = DUTY_CYCLE) -> np.ndarray:
+    """Sigma del ruido por punto (en flujo relativo), vectorizada sobre los candidatos."""
+    depth_frac = np.maximum(0, depth_ppm) / 1e6
+    n_in_per_transit = np.maximum(1, np.floor(np.asarray(duration_hours) * 60 / cadence_minutes))
+    n_transits = np.maximum(1, np.floor(obs_days * duty_cycle / np.maximum(period_days, 1e-9)))
+    return depth_frac * np.sqrt(n_in_per_transit * n_transits) / np.maximum(snr, 1e-9)
+
+def generate_curves(period_days, duration_hours, depth_ppm, impact, points: int = 1000,
+                    n_periods: int = 1, t0: float = 0.0, phase_units: bool = False):
+    """Curvas sin ruido de un lote; devuelve ``(x, flux, meta)``.
+
+    ``x`` y ``flux`` tienen forma (curvas, ``points * n_periods``) y ``meta`` un
+    arreglo por campo de ``generateLightCurves``.
+    """
+    P = np.maximum(np.asarray(period_days, dtype=np.float64), 1e-9)[:, None]
+    D = np.maximum(np.asarray(duration_hours, dtype=np.float64), 1e-9)[:, None] / 24
+    d = np.maximum(np.asarray(depth_ppm, dtype=np.float64), 0)[:, None] / 1e6
+    b = np.clip(np.asarray(impact, dtype=np.float64), 0, 1.1)[:, None]
+    n_periods = max(1, int(n_periods))
+    total = max(2, int(points) * n_periods)
+
+    ramp = 0.5 * D * np.clip(0.1 + 0.3 * b, 0.1, 0.4)
+    flat = np.maximum(D - 2 * ramp, 0)
+    half_flat = flat / 2
+
+    span = P * n_periods
+    time = (t0 - span / 2) + np.arange(total) * (span / (total - 1))
+
+    # fmod conserva el signo como el operador % de JavaScript
+    x = np.abs(np.fmod(time - t0 + 0.5 * P, P) - 0.5 * P)
+    frac = (x - half_flat) / np.maximum(ramp, 1e-12)
+    flux = np.where(x <= half_flat, 1 - d, np.where(frac <= 1, 1 - d * (1 - frac), 1.0))
+
+    x_axis = (time - t0) / P if phase_units else time
+    meta = {"P": P[:, 0], "D": D[:, 0], "depthFrac": d[:, 0], "impact": b[:, 0],
+            "ramp": ramp[:, 0], "flat": flat[:, 0], "t0BKJD": np.full(len(P), t0)}
+    return x_axis, flux, meta
+
+def downsample(x: np.ndarray, flux: np.ndarray, max_points: int):
+    """Reduce cada curva a ``max_points`` conservando el mínimo y el máximo de cada tramo.
+
+    Con un muestreo uniforme un tránsito corto desaparecería de una curva larga;
+    el mínimo de cada tramo lo conserva.
+    """
+    n_curves, total = flux.shape
+    if max_points is None or total <= max_points:
+        return x, flux
+
+    n_buckets = max(1, max_points // 2)
+    size = math.ceil(total / n_buckets)
+    pad = n_buckets * size - total
+    if pad:
+        x = np.pad(x, ((0, 0), (0, pad)), mode="edge")
+        flux = np.pad(flux, ((0, 0), (0, pad)), mode="edge")
+
+    buckets = flux.reshape(n_curves, n_buckets, size)
+    offsets = np.arange(n_buckets)[None, :] * size
+    low = buckets.argmin(axis=2) + offsets
+    high = buckets.argmax(axis=2) + offsets
+
+    # En orden temporal dentro de cada tramo
+    index = np.sort(np.stack([low, high], axis=2), axis=2).reshape(n_curves, -1)
+    return np.take_along_axis(x, index, axis=1), np.take_along_axis(flux, index, axis=1)
+
+def curve_key(candidate: tuple, options: tuple) -> bytes:
+    """Clave de una curva: sus parámetros físicos y las opciones de resolución y ruido."""
+    return struct.pack(f"<{len(candidate)}d", *candidate) + repr(options).encode()
+
+def _noise_rng(key: bytes, seed: int) -> np.random.Generator:
+    digest = hashlib.sha256(key + seed.to_bytes(8, "little", signed=True)).digest()
+    return np.random.default_rng(int.from_bytes(digest[:16], "little"))
+
+class LightCurveCache:
+    def __init__(self, max_bytes: int = LIGHT_CURVE_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # clave -> (x, flux, meta)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_many(self, keys: list) -> list:
+        results = []
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is None:
+                    self.misses += 1
+                else:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                results.append(entry)
+        return results
+
+    def put(self, key, entry: tuple):
+        size = entry[0].nbytes + entry[1].nbytes
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[0].nbytes + previous[1].nbytes
+            self._entries[key] = entry
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (x, flux, _) = self._entries.popitem(last=False)
+                self._bytes -= x.nbytes + flux.nbytes
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+LIGHT_CURVE_CACHE = LightCurveCache()
+
+def light_curves(candidates: list, points: int = 1000, n_periods: int = 1, t0: float = 0.0,
+                 phase_units: bool = False, noise: bool = True, seed: int = 0, max_points: int = None) -> list:
+    """Curvas de luz de un lote de candidatos, como lista de ``(x, flux, meta)``.
+
+    Cada candidato es una tupla ``(koi_period, koi_duration, koi_depth,
+    koi_impact, koi_model_snr)``; sin SNR la curva no lleva ruido. ``x`` y
+    ``flux`` son float32 y tienen como máximo ``max_points`` puntos.
+    """
+    total = max(2, int(points) * max(1, int(n_periods)))
+    if total > LIGHT_CURVE_MAX_POINTS:
+        raise ValueError(f"La curva tendría {total} puntos; el máximo es {LIGHT_CURVE_MAX_POINTS}.")
+    if total * len(candidates) > LIGHT_CURVE_MAX_REQUEST_POINTS:
+        raise ValueError(f"El lote tendría {total * len(candidates)} puntos; "
+                         f"el máximo por petición es {LIGHT_CURVE_MAX_REQUEST_POINTS}.")
+
+    options = (points, n_periods, t0, phase_units, noise, seed, max_points)
+    keys = [curve_key(tuple(float("nan") if v is None else v for v in candidate), options)
+            for candidate in candidates]
+    curves = LIGHT_CURVE_CACHE.get_many(keys) if LIGHT_CURVE_CACHE.max_bytes > 0 else [None] * len(keys)
+    missing = [i for i, curve in enumerate(curves) if curve is None]
+    if not missing:
+        return curves
+
+    # Bloques de curvas para acotar la memoria de las matrices intermedias
+    rows_per_chunk = max(1, CHUNK_ELEMENTS // total)
+    for start in range(0, len(missing), rows_per_chunk):
+        chunk = missing[start:start + rows_per_chunk]
+
+        period, duration, depth, impact, snr = (
+            np.array([np.nan if v is None else v for v in column], dtype=np.float64)
+            for column in zip(*(candidates[i] for i in chunk))
+        )
+        x, flux, meta = generate_curves(period, duration, depth, impact, points, n_periods, t0, phase_units)
+
+        sigma = np.where(np.isnan(snr), 0.0, sigma_from_snr(depth, np.nan_to_num(snr, nan=1.0), duration, period))
+        if noise:
+            for row, i in enumerate(chunk):
+                if sigma[row] > 0:
+                    flux[row] += _noise_rng(keys[i], seed).standard_normal(total) * sigma[row]
+
+        x, flux = downsample(x, flux, max_points)
+        x = x.astype(CURVE_DTYPE)
+        flux = flux.astype(CURVE_DTYPE)
+
+        for row, i in enumerate(chunk):
+            curve_meta = {name: float(values[row]) for name, values in meta.items()}
+            curve_meta["sigma"] = float(sigma[row])
+            # Copias: una fila de la matriz retendría el bloque completo en la caché
+            curves[i] = (x[row].copy(), flux[row].copy(), curve_meta)
+            if LIGHT_CURVE_CACHE.max_bytes > 0:
+                LIGHT_CURVE_CACHE.put(keys[i], curves[i])
+
+    return curves
@@ -0,0 +1,99 @@
+"""Seguimiento por iteración del entrenamiento de LightGBM y XGBoost.
+
+``TrainingMonitor`` recibe el AUC y el logloss de validación de cada iteración,
+los reenvía a ``on_iteration`` y decide cuándo parar: tras ``patience``
+iteraciones sin mejorar el AUC o al agotar ``time_budget`` segundos. Cuando
+para, el modelo se queda con la mejor iteración vista.
+"""
+import math
+import time
+import lightgbm as lgb
+import xgboost as xgb
+
+STOPPED_EARLY = "early_stopping"
+STOPPED_TIME_BUDGET = "time_budget"
+
+class TrainingMonitor:
+    def __init__(self, patience: int = None, time_budget: float = None, on_iteration=None):
+        self.patience = patience
+        self.time_budget = time_budget
+        self.on_iteration = on_iteration
+        self.start = time.perf_counter()
+        self.iterations = 0
+        self.best_iteration = None
+        self.best_auc = -math.inf
+        self.stopped = None
+
+    @property
+    def truncates(self) -> bool:
+        """True si el entrenamiento puede cortarse antes de ``n_estimators``."""
+        return self.patience is not None or self.time_budget is not None
+
+    def update(self, iteration: int, auc: float, logloss: float) -> bool:
+        """Registra una iteración; devuelve True si el entrenamiento debe parar."""
+        elapsed = time.perf_counter() - self.start
+        self.iterations = iteration + 1
+
+        if auc is not None and auc > self.best_auc:
+            self.best_auc = auc
+            self.best_iteration = iteration
+
+        if self.best_iteration is not None:
+            if self.patience is not None and iteration - self.best_iteration >= self.patience:
+                self.stopped = STOPPED_EARLY
+            elif self.time_budget is not None and elapsed >= self.time_budget:
+                self.stopped = STOPPED_TIME_BUDGET
+
+        if self.on_iteration is not None:
+            self.on_iteration({
+                "iteration": iteration,
+                "elapsed": elapsed,
+                "auc": auc,
+                "logloss": logloss,
+                "best_iteration": self.best_iteration,
+                "stopped": self.stopped,
+            })
+
+        return self.truncates and self.stopped is not None
+
+    def summary(self) -> dict:
+        return {
+            "iterations": self.iterations,
+            "best_iteration": self.best_iteration,
+            "best_auc": self.best_auc if self.best_iteration is not None else None,
+            "stopped": self.stopped,
+        }
+
+    def lightgbm_callback(self):
+        best_scores = []
+
+        def callback(env):
+            iteration = env.iteration - env.begin_iteration
+            scores = {metric: value for _, metric, value, *_ in env.evaluation_result_list}
+            stop = self.update(iteration, scores.get("auc"), scores.get("binary_logloss"))
+            if self.best_iteration == iteration:
+                best_scores[:] = env.evaluation_result_list
+            if stop:
+                # LightGBM fija best_iteration y predict usa solo esos árboles
+                raise lgb.callback.EarlyStopException(self.best_iteration, list(best_scores))
+
+        callback.order = 30
+        return callback
+
+    def xgboost_callback(self) -> "xgb.callback.TrainingCallback":
+        return _XGBoostCallback(self)
+
+class _XGBoostCallback(xgb.callback.TrainingCallback):
+    def __init__(self, monitor: TrainingMonitor):
+        super().__init__()
+        self.monitor = monitor
+
+    def after_iteration(self, model, epoch, evals_log) -> bool:
+        scores = {metric: values[-1] for metrics in evals_log.values() for metric, values in metrics.items()}
+        return self.monitor.update(epoch, scores.get("auc"), scores.get("logloss"))
+
+    def after_training(self, model):
+        # Igual que el EarlyStopping de XGBoost: predict usa hasta best_iteration
+        if self.monitor.truncates and self.monitor.best_iteration is not None:
+            model.set_attr(best_iteration=str(self.monitor.best_iteration), best_score=str(self.monitor.best_auc))
+        return model
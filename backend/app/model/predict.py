@@ -1,52 +1,160 @@
+import numpy as np
 import pandas as pd
 import joblib
 import sys
-import csv
-
-KOI_FEATURES = [
-    ('koi_period', 'tce_period'),       # Período Orbital
-    ('koi_time0bk', 'tce_time0bk'),      # Época del Tránsito
-    ('koi_impact', 'tce_impact'),       # Parámetro de Impacto
-    ('koi_duration', 'tce_duration'),     # Duración del Tránsito
-    ('koi_depth', 'tce_depth'),        # Profundidad del Tránsito
-    ('koi_prad', 'tce_prad'),         # Radio Planetario
-    ('koi_teq', 'tce_eqt'),          # Temperatura de Equilibrio
-    ('koi_insol', 'tce_insol'),        # Flujo de Insolación
-    ('koi_model_snr', 'tce_model_snr'),    # Relación Señal a Ruido del Tránsito
-    ('koi_steff', 'tce_steff'),        # Temperatura Estelar Efectiva
-    ('koi_srad', 'tce_sradius'),         # Radio Estelar
-]
+import os
+import threading
+import weakref
+from collections import OrderedDict
+from .compiled import CompiledEnsemble, compiled_path
+from .artifact import artifact_path, load_artifact
+from .features import KOI_FEATURES, to_matrix, as_frame, check_feature_order
+from .. import metrics, governor
+
+# Presupuesto de memoria de la caché de modelos (bytes). Se aproxima con el
+# tamaño en disco de cada artefacto .joblib.
+MODEL_CACHE_MAX_BYTES = int(os.environ.get("MODEL_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+
+class ModelCache:
+    """Caché LRU de modelos deserializados, indexada por ruta y mtime del archivo.
+
+    Si el archivo se reentrena (cambia su mtime) la entrada vieja se descarta y el
+    modelo se vuelve a cargar. Cuando el tamaño acumulado supera ``max_bytes`` se
+    expulsan los modelos usados menos recientemente.
+    """
+
+    def __init__(self, max_bytes: int = MODEL_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # path -> (mtime, size, model)
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, model_path, loader=joblib.load):
+        stat = os.stat(model_path)  # FileNotFoundError si el modelo no existe
+        key = os.path.abspath(model_path)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == stat.st_mtime_ns:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[2]
+            self.misses += 1
+
+        # Deserializar fuera del lock para no bloquear a otros modelos
+        with metrics.stage("model_load"):
+            model = loader(model_path)
+
+        with self._lock:
+            self._discard(key)
+            self._entries[key] = (stat.st_mtime_ns, stat.st_size, model)
+            self._size += stat.st_size
+            # Siempre se conserva al menos el modelo recién cargado
+            while self._size > self.max_bytes and len(self._entries) > 1:
+                old_key = next(iter(self._entries))
+                self._discard(old_key)
+                self.evictions += 1
+
+        return model
+
+    def _discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._size -= entry[1]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+MODEL_CACHE = ModelCache()
+
+# Hasta este número de filas conviene el evaluador compilado; en lotes más
+# grandes el código nativo multihilo de cada librería es más rápido.
+COMPILED_MAX_ROWS = int(os.environ.get("COMPILED_MAX_ROWS", 256))
+
+# Con PREDICT_COMPILED_ONLY=1 los lotes grandes también usan el artefacto mapeado
+# y los .joblib nunca se deserializan: menos memoria por worker a cambio de
+# menor rendimiento en lotes grandes.
+PREDICT_COMPILED_ONLY = os.environ.get("PREDICT_COMPILED_ONLY", "0") == "1"
+
+def load_model(model_path):
+    """Devuelve el modelo en ``model_path`` usando la caché en memoria."""
+    return MODEL_CACHE.get(model_path)
+
+def load_compiled(model_path):
+    """Devuelve el ensamble compilado que acompaña al modelo, o None si no existe.
+
+    Se prefiere el artefacto ``.artifact/`` (mapeado en memoria y compartido entre
+    procesos); los ``.compiled.npz`` anteriores se siguen leyendo.
+    """
+    directory = artifact_path(model_path)
+    if os.path.isdir(directory):
+        # El tamaño del directorio no cuenta contra la caché: sus páginas son compartidas
+        return MODEL_CACHE.get(directory, loader=load_artifact)
+    try:
+        return MODEL_CACHE.get(compiled_path(model_path), loader=CompiledEnsemble.load)
+    except FileNotFoundError:
+        return None
+
+# Modelos ya cargados cuyo orden de columnas se comprobó
+_checked_models = weakref.WeakSet()
+
+def _estimator_for(model_path, n_rows):
+    model = None
+    if n_rows <= COMPILED_MAX_ROWS or PREDICT_COMPILED_ONLY:
+        model = load_compiled(model_path)
+    if model is None:
+        model = load_model(model_path)
+
+    if model not in _checked_models:
+        check_feature_order(model)
+        _checked_models.add(model)
+    return model
+
+def _model_input(model, X: np.ndarray):
+    """El evaluador compilado toma la matriz tal cual; los estimadores validan nombres de columnas."""
+    return X if isinstance(model, CompiledEnsemble) else as_frame(X)
 
 def predict_candidate(model_path, candidate_features):
     """Carga un modelo entrenado y predice la clasificación de un nuevo candidato."""
     
     try:
-        model = joblib.load(model_path)
+        model = _estimator_for(model_path, 1)
     except FileNotFoundError:
         print(f"Error: No se encontró el archivo del modelo en '{model_path}'")
         print("Asegúrate de ejecutar 'train_model.py' primero.")
         return None, None
     
-    # Convierte los valores numéricos que vengan como string
-    for k, v in candidate_features.items():
-        try:
-            candidate_features[k] = float(v)
-        except (ValueError, TypeError):
-            pass  # deja el valor tal cual si no puede convertirse
-
-    candidate_df = pd.DataFrame([candidate_features])
-
-    # Convierte las características del candidato en un DataFrame de Pandas
-    # Es crucial que los nombres de las columnas coincidan con los del entrenamiento
-    candidate_df = pd.DataFrame([candidate_features])
+    # Una fila float32 en el orden de KOI_FEATURES; los strings numéricos también sirven
+    with metrics.stage("dataframe"):
+        candidate = _model_input(model, to_matrix(candidate_features))
     
-    # Realiza la predicción
-    prediction_code = model.predict(candidate_df)[0]
-    prediction_proba = model.predict_proba(candidate_df)[0]
+    # Realiza la predicción; la clase es la de mayor probabilidad, igual que model.predict
+    with metrics.stage("predict"), governor.inference(model, 1):
+        prediction_proba = model.predict_proba(candidate)[0]
+    metrics.count_predictions(1)
     
     # Interpreta los resultados
-    verdict = 'CANDIDATE' if prediction_code == 1 else 'FALSE POSITIVE'
-    confidence = prediction_proba[1] if verdict == 'CANDIDATE' else prediction_proba[0]
+    best = prediction_proba.argmax()
+    verdict = 'CANDIDATE' if np.asarray(model.classes_)[best] == 1 else 'FALSE POSITIVE'
+    confidence = prediction_proba[best]
 
     print("\n--- Veredicto del Modelo ---")
     print(f"Clasificación: {verdict}")
@@ -54,27 +162,67 @@ def predict_candidate(model_path, candidate_features):
 
     return verdict, confidence
 
+def predict_batch(model_path, features_df):
+    """Predice un lote de candidatos con una sola llamada a ``predict_proba``.
+
+    ``features_df`` debe tener las columnas de ``KOI_FEATURES``; se pasa a la
+    matriz float32 del entrenamiento (sin copiar si ya lo es). Devuelve dos
+    arreglos de NumPy ``(verdicts, confidences)``, o ``(None, None)`` si el
+    modelo no existe.
+    """
+    try:
+        model = _estimator_for(model_path, len(features_df))
+    except FileNotFoundError:
+        print(f"Error: No se encontró el archivo del modelo en '{model_path}'")
+        return None, None
+
+    if len(features_df) == 0:
+        return np.array([], dtype=object), np.array([], dtype=float)
+
+    X = _model_input(model, to_matrix(features_df))
+
+    # El veredicto es la clase con mayor probabilidad, igual que model.predict
+    with metrics.stage("predict"), governor.inference(model, len(X)):
+        proba = model.predict_proba(X)
+    metrics.count_predictions(len(features_df))
+    best = proba.argmax(axis=1)
+    codes = np.asarray(model.classes_)[best]
+
+    verdicts = np.where(codes == 1, 'CANDIDATE', 'FALSE POSITIVE')
+    confidences = proba[np.arange(len(proba)), best]
+
+    return verdicts, confidences
+
+def predict_positive_batch(model_path, features_df):
+    """Probabilidad de la clase CANDIDATE para cada fila, o None si el modelo no existe."""
+    try:
+        model = _estimator_for(model_path, len(features_df))
+    except FileNotFoundError:
+        print(f"Error: No se encontró el archivo del modelo en '{model_path}'")
+        return None
+
+    if len(features_df) == 0:
+        return np.array([], dtype=float)
+
+    classes = list(np.asarray(model.classes_))
+    X = _model_input(model, to_matrix(features_df))
+    with metrics.stage("predict"), governor.inference(model, len(X)):
+        proba = model.predict_proba(X)
+    metrics.count_predictions(len(features_df))
+    return proba[:, classes.index(1)]
+
 def main():
     """Función principal para probar la predicción con un candidato de ejemplo."""
 
-    raw = pd.read_csv("./data/raw/events.csv", skiprows=32)
     MODEL_FILE = 'exoplanet_kepler_model.joblib'
-    csvfile = open('predictions.csv', 'w', newline='')
-    csvwriter = csv.writer(csvfile)
-    csvwriter.writerow(['kepid', 'verdict', 'confidence'])
 
     if len(sys.argv) < 2:
-        for row in raw.iterrows():
-            first = row[1].to_dict()
-            nuevo_candidato = { k1: first[k2] for k1, k2 in KOI_FEATURES }
-            print(f"\nProbando candidato con kepid={first['kepid']}")
-            verdict, confidence = predict_candidate(MODEL_FILE, nuevo_candidato)
-            csvwriter.writerow([first['kepid'], verdict, f"{confidence * 100:.2f}%"])
-            print("-" * 30)
-
-        csvfile.close()
+        # El catálogo completo se puntúa por bloques en paralelo
+        from .batch_score import main as batch_main
+        sys.exit(batch_main(["./data/raw/events.csv", "-o", "predictions.csv", "--model-path", MODEL_FILE]))
 
     else:
+        raw = pd.read_csv("./data/raw/events.csv", skiprows=32)
         kepid = int(sys.argv[1])
 
         signal = raw[raw['kepid'] == kepid]
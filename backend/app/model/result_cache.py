@@ -0,0 +1,129 @@
+"""Caché de resultados de predicción por (modelo, vector de características).
+
+La clave de cada fila son los bytes de sus 11 valores de ``KOI_FEATURES`` en
+float32, la misma precisión con la que se evalúan (con -0.0 y NaN
+normalizados). Cada entrada guarda el mtime y tamaño del artefacto con el que
+se calculó; si el modelo se reentrena la entrada queda obsoleta y se recalcula.
+"""
+import os
+import threading
+from collections import OrderedDict
+import numpy as np
+from .predict import predict_batch
+from .features import FEATURE_DTYPE, to_matrix
+
+# Número máximo de filas guardadas; 0 desactiva la caché
+PREDICTION_CACHE_MAX_ENTRIES = int(os.environ.get("PREDICTION_CACHE_MAX_ENTRIES", 100000))
+
+def _artifact_version(model_path):
+    try:
+        stat = os.stat(model_path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+def row_keys(X: np.ndarray) -> list:
+    """Claves canónicas (bytes) para cada fila de una matriz de características."""
+    X = np.array(X, dtype=FEATURE_DTYPE, order="C")
+    X[X == 0] = 0.0            # -0.0 y 0.0 son la misma entrada
+    X[np.isnan(X)] = np.nan    # un solo patrón de bits para NaN
+    return X.view(np.dtype((np.void, X.shape[1] * X.itemsize))).ravel().tolist()
+
+class PredictionCache:
+    def __init__(self, max_entries: int = PREDICTION_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # (path, key) -> (version, verdict, confidence)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+
+    def get_many(self, model_path: str, version, keys: list) -> list:
+        results = []
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get((model_path, key))
+                if entry is not None and entry[0] == version:
+                    self._entries.move_to_end((model_path, key))
+                    self.hits += 1
+                    results.append(entry[1:])
+                else:
+                    if entry is not None:
+                        self.stale += 1
+                    self.misses += 1
+                    results.append(None)
+        return results
+
+    def put_many(self, model_path: str, version, keys: list, verdicts: list, confidences: list):
+        with self._lock:
+            for key, verdict, confidence in zip(keys, verdicts, confidences):
+                self._entries[(model_path, key)] = (version, verdict, confidence)
+                self._entries.move_to_end((model_path, key))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "stale": self.stale,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+PREDICTION_CACHE = PredictionCache()
+
+def predict_batch_cached(model_path, features_df):
+    """``predict_batch`` que solo evalúa las filas que no están en la caché."""
+    version = _artifact_version(model_path)
+    if PREDICTION_CACHE.max_entries <= 0 or version is None or len(features_df) == 0:
+        return predict_batch(model_path, features_df)
+
+    model_path = os.path.abspath(model_path)
+    keys = row_keys(to_matrix(features_df))
+    cached = PREDICTION_CACHE.get_many(model_path, version, keys)
+    missing = [i for i, result in enumerate(cached) if result is None]
+
+    if missing:
+        verdicts, confidences = predict_batch(model_path, features_df.iloc[missing])
+        if verdicts is None:
+            return None, None
+
+        verdicts, confidences = verdicts.tolist(), confidences.tolist()
+        PREDICTION_CACHE.put_many(model_path, version, [keys[i] for i in missing], verdicts, confidences)
+        for i, verdict, confidence in zip(missing, verdicts, confidences):
+            cached[i] = (verdict, confidence)
+
+    return (
+        np.array([verdict for verdict, _ in cached]),
+        np.array([confidence for _, confidence in cached], dtype=float),
+    )
+
+def predict_candidate_cached(model_path, candidate_features, predictor):
+    """Consulta la caché antes de llamar a ``predictor(model_path, candidate_features)``."""
+    version = _artifact_version(model_path)
+    try:
+        X = to_matrix(candidate_features)
+    except KeyError:
+        X = None
+
+    if PREDICTION_CACHE.max_entries <= 0 or version is None or X is None:
+        return predictor(model_path, candidate_features)
+
+    model_path = os.path.abspath(model_path)
+    keys = row_keys(X)
+    cached = PREDICTION_CACHE.get_many(model_path, version, keys)[0]
+    if cached is not None:
+        return cached
+
+    verdict, confidence = predictor(model_path, candidate_features)
+    if verdict is not None:
+        PREDICTION_CACHE.put_many(model_path, version, keys, [verdict], [float(confidence)])
+    return verdict, confidence
@@ -1,50 +1,69 @@
-from fastapi import APIRouter, HTTPException, Form
-from .schemas import CreateModelRequest, PredictRequest
-from . import service
+from fastapi import APIRouter, HTTPException, Form, Depends
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from .schemas import CreateModelRequest, PredictRequest, SweepRequest, EnsemblePredictRequest, ExplainRequest, ContinueTrainingRequest, LightCurveRequest
+from typing import List, Literal, Optional
+from . import service, jobs, sweeps, metrics, governor
 from fastapi import UploadFile
-from .model.predict import predict_candidate, KOI_FEATURES
+from .model.predict import predict_candidate, KOI_FEATURES, MODEL_CACHE
+from .model.features import to_matrix, as_frame
+from .model.batching import PREDICT_BATCHING, predict_candidate_batched, batching_stats
+from .model import ensemble
+from .model.explain import EXPLANATION_CACHE, explain_batch, model_importance
+from .model.result_cache import PREDICTION_CACHE, predict_batch_cached, predict_candidate_cached
+from .model.light_curves import LIGHT_CURVE_CACHE, light_curves
 import pandas as pd
+import numpy as np
+import itertools
+import asyncio
+import json
 import io
+import os
 
 router = APIRouter(prefix="/api", tags=["api"])
 
-@router.post("/predict")
-def predict(req: PredictRequest):
-    model_path = service.get_model(req.model)
+# INFERENCE_ONLY=1: réplica que solo sirve predicciones; no entrena ni toca los
+# trabajos, y nunca importa las librerías de entrenamiento
+INFERENCE_ONLY = os.environ.get("INFERENCE_ONLY", "0") == "1"
 
-    verdict, confidence = predict_candidate(model_path, req.features.model_dump())
+# Filas por bloque al puntuar un CSV en modo streaming
+CSV_CHUNK_SIZE = 10000
 
-    if verdict is None or confidence is None:
-        raise HTTPException(status_code=500, detail="La predicción falló.")
-    
-    return {"status": "success", "prediction": {"verdict": verdict, "confidence": float(confidence)}}
+# Cada cuánto /jobs/{id}/events revisa si hay progreso nuevo
+PROGRESS_POLL_SECONDS = 0.5
 
-@router.post("/model")
-def create_model(req: CreateModelRequest):
-    model_id = service.create_model(req)
-    return {"status": "success", "model_id": model_id}
+#Crear diccionario para renombrar columnas automáticamente
+COLUMN_MAP = {tce: koi for koi, tce in KOI_FEATURES}
 
-@router.post("/predict_csv")
-async def predict_csv(file: UploadFile, model: int = Form(None)):
+metrics.register_stats("exo_model_cache", "Caché de modelos deserializados", MODEL_CACHE.stats)
+metrics.register_stats("exo_prediction_cache", "Caché de resultados de predicción", PREDICTION_CACHE.stats)
+metrics.register_stats("exo_predict_batching", "Micro-batching de /api/predict", batching_stats)
+metrics.register_stats("exo_cpu_governor", "Presupuesto de hilos de entrenamiento e inferencia", governor.stats)
+metrics.register_stats("exo_explanation_cache", "Caché de explicaciones por candidato", EXPLANATION_CACHE.stats)
+metrics.register_stats("exo_light_curve_cache", "Caché de curvas de luz sintéticas", LIGHT_CURVE_CACHE.stats)
 
-    if not file.filename.endswith(".csv"):
-        raise HTTPException(status_code=400, detail="El archivo debe ser un CSV válido.")
+def require_training():
+    if INFERENCE_ONLY:
+        raise HTTPException(status_code=503, detail="Este servidor solo sirve predicciones (INFERENCE_ONLY=1).")
 
-    try:
-        contents = await file.read()
-        df = pd.read_csv(io.StringIO(contents.decode("utf-8")))
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Error al leer el CSV: {str(e)}")
+def resolve_model(model_id: Optional[int]) -> str:
+    """Ruta del modelo; etiqueta además las métricas de la petición con su id y tipo."""
+    metrics.set_model_labels("base" if model_id is None else model_id, None)
+    model_path, model_type = service.get_model_entry(model_id)
+    metrics.set_model_labels("base" if model_type == "base" else model_id, model_type)
+    return model_path
 
-    if df.empty:
-        raise HTTPException(status_code=400, detail="El archivo CSV está vacío.")
+def json_response(content: dict) -> JSONResponse:
+    """Serializa la respuesta aquí para medir la etapa 'serialize'."""
+    with metrics.stage("serialize"):
+        return JSONResponse(content)
+
+def prepare_features(df: pd.DataFrame) -> pd.DataFrame:
+    """Normaliza las columnas de un CSV a KOI_FEATURES y las convierte a números."""
 
     #Normalizar nombres de columnas
     df.columns = df.columns.str.strip().str.lower()
 
-    #Crear diccionario para renombrar columnas automáticamente
-    COLUMN_MAP = {tce: koi for koi, tce in KOI_FEATURES}
-
     #Renombrar las columnas que coincidan con las alternativas
     df.rename(columns=COLUMN_MAP, inplace=True)
 
@@ -60,28 +79,406 @@ async def predict_csv(file: UploadFile, model: int = Form(None)):
         for col in missing_cols:
             df[col] = 0
 
-    # Mantener solo las columnas relevantes
-    df = df[koi_cols]
-    df = df.apply(pd.to_numeric, errors='coerce').fillna(0)
-
-    model_path = service.get_model(model)
-
-# Realizar predicciones fila por fila
-    predictions = []
-    for _, row in df.iterrows():
-        features = row.to_dict()
-        verdict, confidence = predict_candidate(model_path, features)
-        predictions.append({
-            "prediction": {
-                "verdict": verdict,
-                "confidence": float(confidence)
-            }
+    # Mantener solo las columnas relevantes, como matriz float32 en el orden del entrenamiento
+    X = to_matrix(df)
+    X[np.isnan(X)] = 0
+
+    return as_frame(X)
+
+async def read_csv_upload(file: UploadFile) -> pd.DataFrame:
+    """Lee un CSV subido y lo deja listo para predecir."""
+    if not file.filename.endswith(".csv"):
+        raise HTTPException(status_code=400, detail="El archivo debe ser un CSV válido.")
+
+    try:
+        contents = await file.read()
+        df = pd.read_csv(io.StringIO(contents.decode("utf-8")))
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Error al leer el CSV: {str(e)}")
+
+    if df.empty:
+        raise HTTPException(status_code=400, detail="El archivo CSV está vacío.")
+
+    with metrics.stage("dataframe"):
+        return prepare_features(df)
+
+def resolve_models(ids: Optional[List[int]], include_base: bool) -> List[dict]:
+    models = service.get_models(ids, include_base)
+
+    missing = set(ids or []) - {model["id"] for model in models}
+    if missing:
+        raise HTTPException(status_code=404, detail=f"No existen los modelos: {', '.join(map(str, sorted(missing)))}")
+    if not models:
+        raise HTTPException(status_code=400, detail="No hay modelos para evaluar.")
+
+    return models
+
+def prediction_items(positive) -> List[dict]:
+    verdicts, confidences = ensemble.verdicts_from_positive(positive)
+    return [
+        {"verdict": verdict, "confidence": confidence, "probability": probability}
+        for verdict, confidence, probability in zip(verdicts.tolist(), confidences.tolist(), positive.tolist())
+    ]
+
+def ensemble_response(models: List[dict], features_df: pd.DataFrame, methods) -> dict:
+    """Evalúa todos los modelos sobre la misma matriz y arma la respuesta por modelo."""
+    scored = ensemble.score_models(models, features_df)
+
+    results = [
+        {
+            "model": entry["id"],
+            "name": entry["name"],
+            "model_type": entry["model_type"],
+            "error": entry["error"],
+            "predictions": prediction_items(entry["positive"]) if entry["positive"] is not None else None,
+        }
+        for entry in scored
+    ]
+    combined = {method: prediction_items(positive) for method, positive in ensemble.combine(scored, methods).items()}
+
+    return {"models": results, "ensemble": combined}
+
+@router.post("/predict")
+def predict(req: PredictRequest):
+    model_path = resolve_model(req.model)
+
+    predictor = predict_candidate_batched if PREDICT_BATCHING else predict_candidate
+    verdict, confidence = predict_candidate_cached(model_path, req.features.model_dump(), predictor)
+
+    if verdict is None or confidence is None:
+        raise HTTPException(status_code=500, detail="La predicción falló.")
+    
+    return json_response({"status": "success", "prediction": {"verdict": verdict, "confidence": float(confidence)}})
+
+@router.post("/predict/all")
+def predict_all(req: EnsemblePredictRequest):
+    models = resolve_models(req.models, req.include_base)
+    features_df = as_frame(to_matrix(req.features.model_dump()))
+
+    response = ensemble_response(models, features_df, req.ensemble)
+
+    # Una sola fila: se devuelve la predicción directamente en lugar de una lista
+    for result in response["models"]:
+        predictions = result.pop("predictions")
+        result["prediction"] = predictions[0] if predictions else None
+    response["ensemble"] = {method: items[0] for method, items in response["ensemble"].items()}
+
+    return json_response({"status": "success", **response})
+
+@router.post("/explain")
+def explain(req: ExplainRequest):
+    """Contribución de cada característica a la predicción de uno o varios candidatos."""
+    if (req.features is None) == (req.candidates is None):
+        raise HTTPException(status_code=400, detail="Envía 'features' o 'candidates' (solo uno de los dos).")
+
+    candidates = [req.features] if req.features is not None else req.candidates
+    if not candidates:
+        raise HTTPException(status_code=400, detail="La lista de candidatos está vacía.")
+
+    model_path = resolve_model(req.model)
+    with metrics.stage("dataframe"):
+        features_df = as_frame(to_matrix([candidate.model_dump() for candidate in candidates]))
+
+    try:
+        result = explain_batch(model_path, features_df)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if result is None:
+        raise HTTPException(status_code=500, detail="La explicación falló.")
+
+    # Un solo candidato: se devuelve la explicación directamente en lugar de una lista
+    if req.features is not None:
+        result["explanation"] = result.pop("explanations")[0]
+
+    return json_response({"status": "success", **result})
+
+@router.get("/importance")
+def importance(model: Optional[int] = None):
+    """Importancia de las características calculada al entrenar el modelo."""
+    model_path = resolve_model(model)
+
+    try:
+        features = model_importance(model_path)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if features is None:
+        raise HTTPException(status_code=404, detail="No se encontró el archivo del modelo.")
+
+    return {"status": "success", "importance": features}
+
+@router.get("/explain/cache")
+def explanation_cache_stats():
+    return {"status": "success", "cache": EXPLANATION_CACHE.stats()}
+
+@router.post("/light_curve")
+def light_curve(req: LightCurveRequest):
+    """Curvas de luz sintéticas de uno o varios candidatos, como las de la vista de gráficas."""
+    if (req.candidate is None) == (req.candidates is None):
+        raise HTTPException(status_code=400, detail="Envía 'candidate' o 'candidates' (solo uno de los dos).")
+
+    candidates = [req.candidate] if req.candidate is not None else req.candidates
+    if not candidates:
+        raise HTTPException(status_code=400, detail="La lista de candidatos está vacía.")
+
+    try:
+        with metrics.stage("light_curve"):
+            curves = light_curves(
+                [(c.koi_period, c.koi_duration, c.koi_depth, c.koi_impact, c.koi_model_snr) for c in candidates],
+                points=req.points, n_periods=req.n_periods, t0=req.t0, phase_units=req.phase_units,
+                noise=req.noise, seed=req.seed, max_points=req.max_points,
+            )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if req.format == "binary":
+        # Todas las curvas tienen el mismo número de puntos: x de cada curva y luego sus flujos
+        with metrics.stage("serialize"):
+            body = b"".join([x.astype("<f4").tobytes() for x, _, _ in curves]
+                            + [flux.astype("<f4").tobytes() for _, flux, _ in curves])
+        return Response(body, media_type="application/octet-stream", headers={
+            "X-Curve-Count": str(len(curves)),
+            "X-Curve-Points": str(len(curves[0][0])),
         })
 
-    return {"status": "success", "count": len(predictions), "predictions": predictions}
+    items = [{"x": x.tolist(), "flux": flux.tolist(), "meta": meta} for x, flux, meta in curves]
+    if req.candidate is not None:
+        return json_response({"status": "success", "curve": items[0]})
+    return json_response({"status": "success", "curves": items})
+
+@router.get("/light_curve/cache")
+def light_curve_cache_stats():
+    return {"status": "success", "cache": LIGHT_CURVE_CACHE.stats()}
+
+@router.post("/model", status_code=202, dependencies=[Depends(require_training)])
+def create_model(req: CreateModelRequest, response: Response, force: bool = False):
+    """Encola el entrenamiento; si ya existe un modelo con los mismos parámetros y
+    datos lo devuelve directamente (200 con ``model_id``). ``force=true`` reentrena.
+    """
+    result = jobs.submit_or_reuse(req, force=force)
+
+    if "model_id" in result:
+        response.status_code = 200
+
+    return {"status": "success", **result}
+
+@router.post("/models/{model_id}/continue", status_code=202, dependencies=[Depends(require_training)])
+def continue_model(model_id: int, req: ContinueTrainingRequest, response: Response, force: bool = False):
+    """Agrega árboles a un modelo registrado con los candidatos nuevos en lugar de
+    reentrenarlo desde cero. El resultado se registra como un modelo nuevo con
+    ``parent_id``; mismas respuestas que ``POST /model``.
+    """
+    models = service.get_models([model_id])
+    if not models:
+        raise HTTPException(status_code=404, detail="No existe el modelo.")
+    if not os.path.exists(models[0]["path"]):
+        raise HTTPException(status_code=404, detail="No se encontró el archivo del modelo.")
+
+    try:
+        result = jobs.continue_or_reuse(model_id, models[0]["path"], req, force=force)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if "model_id" in result:
+        response.status_code = 200
+
+    return {"status": "success", **result}
+
+@router.get("/jobs/{job_id}", dependencies=[Depends(require_training)])
+def get_job(job_id: int):
+    job = jobs.get_job(job_id)
+
+    if job is None:
+        raise HTTPException(status_code=404, detail="No existe el trabajo de entrenamiento.")
+
+    return {"status": "success", "job": job}
+
+@router.get("/jobs/{job_id}/progress", dependencies=[Depends(require_training)])
+def get_job_progress(job_id: int, since: int = -1):
+    """AUC/logloss de validación por iteración; ``since`` omite las ya recibidas."""
+    job = jobs.get_job(job_id)
+
+    if job is None:
+        raise HTTPException(status_code=404, detail="No existe el trabajo de entrenamiento.")
+
+    return {"status": "success", "job_status": job["status"], "progress": jobs.get_progress(job_id, since)}
+
+@router.get("/jobs/{job_id}/events", dependencies=[Depends(require_training)])
+async def job_events(job_id: int):
+    """Progreso del entrenamiento como Server-Sent Events.
+
+    Envía un evento ``progress`` por iteración y termina con ``done`` y el estado
+    final del trabajo.
+    """
+    if await run_in_threadpool(jobs.get_job, job_id) is None:
+        raise HTTPException(status_code=404, detail="No existe el trabajo de entrenamiento.")
+
+    async def stream():
+        since = -1
+        while True:
+            # El estado se lee antes que el progreso para no perder las últimas iteraciones
+            job = await run_in_threadpool(jobs.get_job, job_id)
+            for row in await run_in_threadpool(jobs.get_progress, job_id, since):
+                yield f"event: progress\ndata: {json.dumps(row)}\n\n"
+                since = row["iteration"]
+
+            if job["status"] in (jobs.JOB_SUCCEEDED, jobs.JOB_FAILED):
+                yield f"event: done\ndata: {json.dumps(job)}\n\n"
+                return
+
+            await asyncio.sleep(PROGRESS_POLL_SECONDS)
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@router.post("/sweeps", status_code=202, dependencies=[Depends(require_training)])
+def create_sweep(req: SweepRequest):
+    try:
+        sweep_id = sweeps.submit_sweep(req)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return {"status": "success", "sweep_id": sweep_id}
+
+@router.get("/sweeps/{sweep_id}", dependencies=[Depends(require_training)])
+def get_sweep(sweep_id: int):
+    sweep = sweeps.get_sweep(sweep_id)
+
+    if sweep is None:
+        raise HTTPException(status_code=404, detail="No existe el barrido de hiperparámetros.")
+
+    return {"status": "success", "sweep": sweep}
+
+@router.post("/predict_csv")
+async def predict_csv(file: UploadFile, model: int = Form(None)):
+
+    model_path = resolve_model(model)
+
+    df = await read_csv_upload(file)
+
+    # Predicción vectorizada de todo el archivo con una sola carga del modelo
+    verdicts, confidences = predict_batch_cached(model_path, df)
+
+    if verdicts is None:
+        raise HTTPException(status_code=500, detail="La predicción falló.")
+
+    predictions = [
+        {"prediction": {"verdict": verdict, "confidence": confidence}}
+        for verdict, confidence in zip(verdicts.tolist(), confidences.tolist())
+    ]
+
+    return json_response({"status": "success", "count": len(predictions), "predictions": predictions})
+
+@router.post("/predict_csv/all")
+async def predict_csv_all(
+    file: UploadFile,
+    models: str = Form(None),
+    include_base: bool = Form(False),
+    ensemble_methods: str = Form("", alias="ensemble"),
+):
+    """Variante CSV de /predict/all; ``models`` y ``ensemble`` son listas separadas por comas."""
+    try:
+        ids = [int(id) for id in models.split(",") if id.strip()] if models else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="'models' debe ser una lista de ids separados por comas.")
+
+    methods = [method.strip() for method in ensemble_methods.split(",") if method.strip()]
+    unknown = set(methods) - set(ensemble.ENSEMBLE_METHODS)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Métodos de ensamble no válidos: {', '.join(sorted(unknown))}")
+
+    df = await read_csv_upload(file)
+    resolved = resolve_models(ids, include_base)
+
+    response = await run_in_threadpool(ensemble_response, resolved, df, methods)
+
+    return json_response({"status": "success", "count": len(df), **response})
+
+@router.post("/predict_csv/stream")
+def predict_csv_stream(
+    file: UploadFile,
+    model: int = Form(None),
+    chunk_size: int = Form(CSV_CHUNK_SIZE),
+    format: Literal["ndjson", "csv"] = Form("ndjson"),
+):
+    """Puntúa un CSV por bloques y devuelve los resultados a medida que se calculan.
+
+    La respuesta es NDJSON (una predicción por línea) o CSV, así la memoria no
+    depende del tamaño del archivo y los primeros resultados llegan antes de
+    terminar de leerlo.
+    """
+    if not file.filename.endswith(".csv"):
+        raise HTTPException(status_code=400, detail="El archivo debe ser un CSV válido.")
 
+    if chunk_size <= 0:
+        raise HTTPException(status_code=400, detail="chunk_size debe ser mayor que 0.")
+
+    try:
+        reader = pd.read_csv(file.file, chunksize=chunk_size)
+        first = next(reader, None)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Error al leer el CSV: {str(e)}")
+
+    if first is None or first.empty:
+        raise HTTPException(status_code=400, detail="El archivo CSV está vacío.")
+
+    # Validar y puntuar el primer bloque antes de empezar a responder: si el
+    # modelo no existe el cliente recibe el mismo error que en /predict_csv
+    model_path = resolve_model(model)
+    with metrics.stage("dataframe"):
+        first = prepare_features(first)
+
+    first_result = predict_batch_cached(model_path, first)
+    if first_result[0] is None:
+        raise HTTPException(status_code=500, detail="La predicción falló.")
+
+    labels = metrics.model_labels()
+
+    def generate():
+        row = 0
+        if format == "csv":
+            yield "row,verdict,confidence\n"
+
+        chunks = itertools.chain([first], (prepare_features(chunk) for chunk in reader))
+        for chunk in chunks:
+            if row == 0:
+                verdicts, confidences = first_result
+            else:
+                # Cada bloque se genera en otro contexto; se restauran las etiquetas del modelo
+                metrics.set_model_labels(**labels)
+                verdicts, confidences = predict_batch_cached(model_path, chunk)
+            if verdicts is None:
+                # Cortar la respuesta con error en lugar de terminarla como si estuviera completa
+                raise RuntimeError(f"La predicción falló a partir de la fila {row}.")
+
+            if format == "csv":
+                out = pd.DataFrame({
+                    "row": range(row, row + len(chunk)),
+                    "verdict": verdicts,
+                    "confidence": confidences,
+                })
+                yield out.to_csv(index=False, header=False)
+            else:
+                yield "".join(
+                    json.dumps({"row": i, "prediction": {"verdict": verdict, "confidence": confidence}}) + "\n"
+                    for i, verdict, confidence in zip(
+                        range(row, row + len(chunk)), verdicts.tolist(), confidences.tolist()
+                    )
+                )
+            row += len(chunk)
+
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    return StreamingResponse(generate(), media_type=media_type)
 
 @router.get("/models")
 def list_models():
     models = service.list_models()
     return {"status": "success", "models": models}
+
+@router.get("/predict/cache")
+def prediction_cache_stats():
+    return {"status": "success", "cache": PREDICTION_CACHE.stats()}
+
+@router.get("/models/cache")
+def model_cache_stats():
+    return {"status": "success", "cache": MODEL_CACHE.stats()}
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import List, Optional, Union, Literal, Annotated
+from typing import Dict, List, Optional, Union, Literal, Annotated
 
 class CandidateFeatures(BaseModel):
     koi_period: float        # Período Orbital
@@ -18,6 +18,44 @@ class PredictRequest(BaseModel):
     model: Optional[int] = Field(None, description="Identificador del modelo (opcional). Vacío significa usar el modelo base.")
     features: CandidateFeatures
 
+class EnsemblePredictRequest(BaseModel):
+    features: CandidateFeatures
+    models: Optional[List[int]] = Field(None, description="Modelos a evaluar. Vacío significa todos los modelos registrados.")
+    include_base: bool = Field(False, description="Incluir también el modelo base.")
+    ensemble: List[Literal["soft_vote", "weighted_vote"]] = Field(default_factory=list, description="Combinaciones a calcular.")
+
+class ExplainRequest(BaseModel):
+    model: Optional[int] = Field(None, description="Identificador del modelo (opcional). Vacío significa usar el modelo base.")
+    features: Optional[CandidateFeatures] = Field(None, description="Un solo candidato.")
+    candidates: Optional[List[CandidateFeatures]] = Field(None, description="Lote de candidatos; se explican en una sola pasada.")
+
+class LabelledCandidate(CandidateFeatures):
+    koi_disposition: Literal["CONFIRMED", "CANDIDATE", "FALSE POSITIVE"]
+
+class ContinueTrainingRequest(BaseModel):
+    n_estimators: int = Field(100, ge=1, description="Árboles que se agregan al modelo.")
+    learning_rate: Optional[float] = Field(None, gt=0, description="Tasa de aprendizaje de los árboles nuevos (solo modelos boosted).")
+    candidates: List[LabelledCandidate] = Field(default_factory=list, description="Candidatos nuevos etiquetados que se suman al entrenamiento.")
+
+class CurveCandidate(BaseModel):
+    koi_period: float = Field(..., gt=0)                  # Período Orbital
+    koi_duration: float = Field(..., gt=0)                # Duración del Tránsito
+    koi_depth: float                                      # Profundidad del Tránsito
+    koi_impact: float = 0.3                               # Parámetro de Impacto
+    koi_model_snr: Optional[float] = Field(None, gt=0)    # Relación Señal a Ruido; vacío significa sin ruido
+
+class LightCurveRequest(BaseModel):
+    candidate: Optional[CurveCandidate] = Field(None, description="Un solo candidato.")
+    candidates: Optional[List[CurveCandidate]] = Field(None, description="Lote de candidatos; se calculan en una sola pasada.")
+    points: int = Field(1000, ge=2, description="Puntos por período.")
+    n_periods: int = Field(1, ge=1, description="Períodos que cubre la curva.")
+    t0: float = Field(0.0, description="Centro del tránsito (BKJD).")
+    phase_units: bool = Field(False, description="Eje x en fase (períodos) en lugar de días.")
+    noise: bool = Field(True, description="Agrega ruido gaussiano según koi_model_snr.")
+    seed: int = Field(0, ge=0, lt=2**63, description="Semilla del ruido.")
+    max_points: Optional[int] = Field(None, ge=2, description="Reduce cada curva a este número de puntos conservando mínimos y máximos.")
+    format: Literal["json", "binary"] = Field("json", description="'binary': float32 little-endian, todas las x y luego todos los flujos.")
+
 # LightGBM Parameters
 class LightGBMParams(BaseModel):
     model_type: Literal["light_gbm"] = "light_gbm"
@@ -29,6 +67,9 @@ class LightGBMParams(BaseModel):
     lambda_l2: Optional[float] = None
     feature_fraction: Optional[float] = None
     random_state: Optional[int] = None
+    early_stopping_rounds: Optional[int] = Field(None, ge=1, description="Iteraciones sin mejorar el AUC de validación antes de parar.")
+    time_budget_seconds: Optional[float] = Field(None, gt=0, description="Tiempo máximo de entrenamiento en segundos.")
+    cv_folds: Optional[int] = Field(None, ge=2, le=20, description="Valida con este número de folds estratificados en paralelo y entrena el modelo final con todo el dataset (menos la validación de la parada anticipada, si se pide).")
 
 # XGBoost Parameters
 class XGBoostParams(BaseModel):
@@ -41,6 +82,9 @@ class XGBoostParams(BaseModel):
     reg_lambda: Optional[float] = None
     reg_alpha: Optional[float] = None
     random_state: Optional[int] = None
+    early_stopping_rounds: Optional[int] = Field(None, ge=1, description="Iteraciones sin mejorar el AUC de validación antes de parar.")
+    time_budget_seconds: Optional[float] = Field(None, gt=0, description="Tiempo máximo de entrenamiento en segundos.")
+    cv_folds: Optional[int] = Field(None, ge=2, le=20, description="Valida con este número de folds estratificados en paralelo y entrena el modelo final con todo el dataset (menos la validación de la parada anticipada, si se pide).")
 
 # Random Forest Parameters
 class RandomForestParams(BaseModel):
@@ -50,6 +94,7 @@ class RandomForestParams(BaseModel):
     min_samples_leaf: Optional[int] = None
     min_samples_split: Optional[int] = None
     random_state: Optional[int] = None
+    cv_folds: Optional[int] = Field(None, ge=2, le=20, description="Valida con este número de folds estratificados en paralelo y entrena el modelo final con todo el dataset.")
 
 # Discriminated Union for Create Model Request
 CreateModelRequest = Annotated[
@@ -57,6 +102,20 @@ CreateModelRequest = Annotated[
     Field(discriminator='model_type')
 ]
 
+# Hyperparameter sweep with successive halving
+class SweepRequest(BaseModel):
+    model_type: Literal["light_gbm", "xgboost", "random_forest"]
+    space: Dict[str, List[Union[int, float]]] = Field(..., description="Valores a probar por hiperparámetro (grid).")
+    base_params: Dict[str, Union[int, float]] = Field(default_factory=dict, description="Hiperparámetros fijos para todos los candidatos.")
+    n_candidates: Optional[int] = Field(None, ge=1, description="Muestrea este número de combinaciones del grid.")
+    resource: Literal["n_estimators", "data_fraction"] = "n_estimators"
+    min_resource: Optional[float] = Field(None, gt=0)
+    max_resource: Optional[float] = Field(None, gt=0)
+    eta: int = Field(3, ge=2, description="Factor de reducción entre rondas.")
+    keep: int = Field(1, ge=1, description="Número de ganadores que se guardan como modelos.")
+    metric: Literal["roc_auc", "pr_auc", "accuracy"] = "roc_auc"
+    seed: int = 42
+
 # Response Models
 class LightGBMParamsResponse(LightGBMParams):
     id: int
@@ -72,7 +131,9 @@ class Model(BaseModel):
     name: str
     path: str
     model_type: str
+    parent_id: Optional[int] = None
     accuracy: Optional[float] = None
     roc_auc: Optional[float] = None
     pr_auc: Optional[float] = None
+    cv: Optional[dict] = None
     params: Optional[Union[LightGBMParamsResponse, XGBoostParamsResponse, RandomForestParamsResponse]] = None
\ No newline at end of file
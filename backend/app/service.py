@@ -1,225 +1,404 @@
 import os
-import sqlite3
-from typing import Optional, Union
+import json
+import hashlib
+from typing import List, Optional, Tuple, Union
 from .schemas import CreateModelRequest, LightGBMParams, XGBoostParams, RandomForestParams
-from .model.kepler import train_and_evaluate_model
+from . import db, metrics
 
 BASE_DIR = os.path.dirname(os.path.dirname(__file__))
 MODELOS = os.path.join(BASE_DIR, "app", "model", "outputs")
 
 BASE_ML_MODEL = str(os.path.join(MODELOS, "exoplanet_kepler_model.joblib"))
 
-def get_model(id: Optional[int]) -> str:
+def get_model_entry(id: Optional[int]) -> Tuple[str, str]:
+    """Resolve a model id to (path, model_type); unknown ids fall back to the base model."""
     if id is None:
-        return BASE_ML_MODEL
+        return BASE_ML_MODEL, "base"
+
+    with metrics.stage("db_lookup"):
+        row = db.get_connection().execute("SELECT path, model_type FROM model WHERE id = ?", (id,)).fetchone()
+
+    return (row[0], row[1]) if row else (BASE_ML_MODEL, "base")
+
+def get_model(id: Optional[int]) -> str:
+    return get_model_entry(id)[0]
+
+def get_models(ids: Optional[List[int]] = None, include_base: bool = False) -> List[dict]:
+    """Resolve registered models (all of them when ids is None) to their artifact paths.
+
+    Ids that do not exist are left out; callers compare against what they asked for.
+    """
+    conn = db.get_connection()
+
+    if ids is None:
+        rows = conn.execute("SELECT id, name, path, model_type, roc_auc FROM model ORDER BY id").fetchall()
+    elif ids:
+        placeholders = ", ".join("?" for _ in ids)
+        rows = conn.execute(
+            f"SELECT id, name, path, model_type, roc_auc FROM model WHERE id IN ({placeholders}) ORDER BY id",
+            tuple(ids),
+        ).fetchall()
+    else:
+        rows = []
+
+    models = [
+        {"id": id, "name": name, "path": path, "model_type": model_type, "roc_auc": roc_auc}
+        for id, name, path, model_type, roc_auc in rows
+    ]
+
+    if include_base:
+        models.insert(0, {
+            "id": None,
+            "name": os.path.basename(BASE_ML_MODEL),
+            "path": BASE_ML_MODEL,
+            "model_type": None,
+            "roc_auc": None,
+        })
+
+    return models
+
+# Bump when a change to the training code makes earlier artifacts stale
+TRAINING_FINGERPRINT_VERSION = 1
+
+def init_model_schema():
+    """Migrate the columns and tables read by list_models; runs on every replica, inference-only included."""
+    with db.transaction() as cursor:
+        # Continued models point at the model they were trained from
+        columns = {row[1] for row in cursor.execute("PRAGMA table_info(model)")}
+        if "parent_id" not in columns:
+            cursor.execute("ALTER TABLE model ADD COLUMN parent_id INTEGER REFERENCES model(id)")
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS model_cv (
+                model_id INTEGER PRIMARY KEY,
+                folds INTEGER NOT NULL,
+                accuracy_std REAL NOT NULL,
+                roc_auc_std REAL NOT NULL,
+                pr_auc_std REAL NOT NULL,
+                fold_metrics TEXT NOT NULL,
+                FOREIGN KEY (model_id) REFERENCES model(id)
+            )
+        """)
+
+def init_fingerprint_table():
+    with db.transaction() as cursor:
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS model_fingerprint (
+                fingerprint TEXT PRIMARY KEY,
+                model_id INTEGER NOT NULL,
+                FOREIGN KEY (model_id) REFERENCES model(id)
+            )
+        """)
+
+def get_cv_results() -> dict:
+    """Cross-validation summary of every cross-validated model, by model id."""
+    rows = db.get_connection().execute("""
+        SELECT model_id, folds, accuracy_std, roc_auc_std, pr_auc_std, fold_metrics FROM model_cv
+    """).fetchall()
+
+    return {
+        model_id: {
+            "folds": folds,
+            "accuracy_std": accuracy_std,
+            "roc_auc_std": roc_auc_std,
+            "pr_auc_std": pr_auc_std,
+            "fold_metrics": json.loads(fold_metrics),
+        }
+        for model_id, folds, accuracy_std, roc_auc_std, pr_auc_std, fold_metrics in rows
+    }
 
-    conn = sqlite3.connect(os.path.join(BASE_DIR, "app", "db.sqlite3"))
-    cursor = conn.cursor()
-    cursor.execute("SELECT path FROM model WHERE id = ?", (id,))
-    row = cursor.fetchone()
-    conn.close()
+def training_fingerprint(data: Union[LightGBMParams, XGBoostParams, RandomForestParams]) -> str:
+    """Identify a training run by model type, normalized params and dataset contents.
 
-    return row[0] if row else BASE_ML_MODEL
+    Unset params are dropped so that leaving one out and sending null are the
+    same request; both train with the library default.
+    """
+    from .model.kepler import kepler_dataset_key
 
-def create_model(data: Union[LightGBMParams, XGBoostParams, RandomForestParams]) -> int:
-    conn = sqlite3.connect(os.path.join(BASE_DIR, "app", "db.sqlite3"))
-    cursor = conn.cursor()
+    params = {
+        name: value for name, value in data.model_dump().items()
+        if value is not None and name != "model_type"
+    }
+    payload = {
+        "version": TRAINING_FINGERPRINT_VERSION,
+        "model_type": data.model_type,
+        "params": params,
+        "dataset": kepler_dataset_key(),
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+def continuation_fingerprint(parent_path: str, n_estimators: int, learning_rate: Optional[float],
+                             X_delta, y_delta) -> str:
+    """Identify a continued training run by its parent artifact, request and new rows."""
+    from .model.kepler import kepler_dataset_key, _file_sha256
+
+    rows = hashlib.sha256(X_delta.tobytes() + y_delta.tobytes()).hexdigest()
+    payload = {
+        "version": TRAINING_FINGERPRINT_VERSION,
+        "parent": _file_sha256(parent_path),
+        "n_estimators": n_estimators,
+        "learning_rate": learning_rate,
+        "rows": rows,
+        "dataset": kepler_dataset_key(),
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+def find_model_by_fingerprint(fingerprint: str) -> Optional[int]:
+    """Id of a registered model trained from the same fingerprint whose artifact is still on disk."""
+    row = db.get_connection().execute("""
+        SELECT m.id, m.path FROM model_fingerprint f
+        JOIN model m ON m.id = f.model_id
+        WHERE f.fingerprint = ?
+    """, (fingerprint,)).fetchone()
+
+    if row is None or not os.path.exists(row[1]):
+        return None
+
+    return row[0]
+
+def create_model(data: Union[LightGBMParams, XGBoostParams, RandomForestParams], force: bool = False) -> int:
+    """Train a model synchronously and register it. Returns the model id.
+
+    An identical model that was already trained is returned as is unless ``force``.
+    """
+    fingerprint = training_fingerprint(data)
+    if not force:
+        model_id = find_model_by_fingerprint(fingerprint)
+        if model_id is not None:
+            return model_id
+
+    # Training stack is only imported where training actually happens
+    from .model.kepler import train_and_evaluate_model
 
     params = data.model_dump()
-    model_type = data.model_type
 
     # Train the model
-    name, accuracy, roc_auc, pr_auc = train_and_evaluate_model(model_type=model_type, params=params)
+    name, accuracy, roc_auc, pr_auc, cv = train_and_evaluate_model(model_type=data.model_type, params=params)
+
+    return register_model(data, name, accuracy, roc_auc, pr_auc, fingerprint, cv=cv)
+
+def register_model(
+    data: Union[LightGBMParams, XGBoostParams, RandomForestParams],
+    name: str,
+    accuracy: float,
+    roc_auc: float,
+    pr_auc: float,
+    fingerprint: Optional[str] = None,
+    parent_id: Optional[int] = None,
+    cv: Optional[dict] = None,
+) -> int:
+    """Store the params and metrics of an already trained model artifact.
+
+    ``parent_id`` links a model continued from another one to its parent. For a
+    cross-validated model the metrics are fold means and ``cv`` holds their
+    standard deviations.
+    """
+    model_type = data.model_type
 
     # Insert parameters into the appropriate table
     params_id = None
-    
-    if isinstance(data, LightGBMParams):
-        cursor.execute("""
-            INSERT INTO lightgbm_params (
-                learning_rate, n_estimators, num_leaves, max_depth,
-                lambda_l1, lambda_l2, feature_fraction, random_state
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        """, (
-            data.learning_rate,
-            data.n_estimators,
-            data.num_leaves,
-            data.max_depth,
-            data.lambda_l1,
-            data.lambda_l2,
-            data.feature_fraction,
-            data.random_state
-        ))
-        params_id = cursor.lastrowid
-        
-        cursor.execute("""
-            INSERT INTO model (
-                name, path, model_type, accuracy, roc_auc, pr_auc, lightgbm_params_id
-            ) VALUES (?, ?, ?, ?, ?, ?, ?)
-        """, (
-            name,
-            os.path.join(MODELOS, name),
-            model_type,
-            accuracy,
-            roc_auc,
-            pr_auc,
-            params_id
-        ))
-        
-    elif isinstance(data, XGBoostParams):
-        cursor.execute("""
-            INSERT INTO xgboost_params (
-                learning_rate, n_estimators, max_depth, subsample,
-                colsample_bytree, reg_lambda, reg_alpha, random_state
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        """, (
-            data.learning_rate,
-            data.n_estimators,
-            data.max_depth,
-            data.subsample,
-            data.colsample_bytree,
-            data.reg_lambda,
-            data.reg_alpha,
-            data.random_state
-        ))
-        params_id = cursor.lastrowid
-        
-        cursor.execute("""
-            INSERT INTO model (
-                name, path, model_type, accuracy, roc_auc, pr_auc, xgboost_params_id
-            ) VALUES (?, ?, ?, ?, ?, ?, ?)
-        """, (
-            name,
-            os.path.join(MODELOS, name),
-            model_type,
-            accuracy,
-            roc_auc,
-            pr_auc,
-            params_id
-        ))
-        
-    elif isinstance(data, RandomForestParams):
-        cursor.execute("""
-            INSERT INTO randomforest_params (
-                n_estimators, max_depth, min_samples_leaf, 
-                min_samples_split, random_state
-            ) VALUES (?, ?, ?, ?, ?)
-        """, (
-            data.n_estimators,
-            data.max_depth,
-            data.min_samples_leaf,
-            data.min_samples_split,
-            data.random_state
-        ))
-        params_id = cursor.lastrowid
-        
-        cursor.execute("""
-            INSERT INTO model (
-                name, path, model_type, accuracy, roc_auc, pr_auc, randomforest_params_id
-            ) VALUES (?, ?, ?, ?, ?, ?, ?)
-        """, (
-            name,
-            os.path.join(MODELOS, name),
-            model_type,
-            accuracy,
-            roc_auc,
-            pr_auc,
-            params_id
-        ))
-
-    conn.commit()
-    model_id = cursor.lastrowid
-    conn.close()
+
+    with db.transaction() as cursor:
+        if isinstance(data, LightGBMParams):
+            cursor.execute("""
+                INSERT INTO lightgbm_params (
+                    learning_rate, n_estimators, num_leaves, max_depth,
+                    lambda_l1, lambda_l2, feature_fraction, random_state
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, (
+                data.learning_rate,
+                data.n_estimators,
+                data.num_leaves,
+                data.max_depth,
+                data.lambda_l1,
+                data.lambda_l2,
+                data.feature_fraction,
+                data.random_state
+            ))
+            params_id = cursor.lastrowid
+
+            cursor.execute("""
+                INSERT INTO model (
+                    name, path, model_type, accuracy, roc_auc, pr_auc, lightgbm_params_id
+                ) VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, (
+                name,
+                os.path.join(MODELOS, name),
+                model_type,
+                accuracy,
+                roc_auc,
+                pr_auc,
+                params_id
+            ))
+
+        elif isinstance(data, XGBoostParams):
+            cursor.execute("""
+                INSERT INTO xgboost_params (
+                    learning_rate, n_estimators, max_depth, subsample,
+                    colsample_bytree, reg_lambda, reg_alpha, random_state
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, (
+                data.learning_rate,
+                data.n_estimators,
+                data.max_depth,
+                data.subsample,
+                data.colsample_bytree,
+                data.reg_lambda,
+                data.reg_alpha,
+                data.random_state
+            ))
+            params_id = cursor.lastrowid
+
+            cursor.execute("""
+                INSERT INTO model (
+                    name, path, model_type, accuracy, roc_auc, pr_auc, xgboost_params_id
+                ) VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, (
+                name,
+                os.path.join(MODELOS, name),
+                model_type,
+                accuracy,
+                roc_auc,
+                pr_auc,
+                params_id
+            ))
+
+        elif isinstance(data, RandomForestParams):
+            cursor.execute("""
+                INSERT INTO randomforest_params (
+                    n_estimators, max_depth, min_samples_leaf, 
+                    min_samples_split, random_state
+                ) VALUES (?, ?, ?, ?, ?)
+            """, (
+                data.n_estimators,
+                data.max_depth,
+                data.min_samples_leaf,
+                data.min_samples_split,
+                data.random_state
+            ))
+            params_id = cursor.lastrowid
+
+            cursor.execute("""
+                INSERT INTO model (
+                    name, path, model_type, accuracy, roc_auc, pr_auc, randomforest_params_id
+                ) VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, (
+                name,
+                os.path.join(MODELOS, name),
+                model_type,
+                accuracy,
+                roc_auc,
+                pr_auc,
+                params_id
+            ))
+
+        model_id = cursor.lastrowid
+
+        if parent_id is not None:
+            cursor.execute("UPDATE model SET parent_id = ? WHERE id = ?", (parent_id, model_id))
+
+        if cv is not None:
+            cursor.execute("""
+                INSERT INTO model_cv (model_id, folds, accuracy_std, roc_auc_std, pr_auc_std, fold_metrics)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, (
+                model_id,
+                cv["folds"],
+                cv["accuracy_std"],
+                cv["roc_auc_std"],
+                cv["pr_auc_std"],
+                json.dumps(cv["fold_metrics"]),
+            ))
+
+        # A forced retrain takes over the fingerprint from the previous model
+        if fingerprint is not None:
+            cursor.execute(
+                "INSERT OR REPLACE INTO model_fingerprint (fingerprint, model_id) VALUES (?, ?)",
+                (fingerprint, model_id),
+            )
 
     return model_id
 
+# Columns of each params table, in the order they are returned by /api/models
+PARAMS_COLUMNS = {
+    "light_gbm": ("lightgbm_params", "lightgbm_params_id", [
+        "learning_rate", "n_estimators", "num_leaves", "max_depth",
+        "lambda_l1", "lambda_l2", "feature_fraction", "random_state",
+    ]),
+    "xgboost": ("xgboost_params", "xgboost_params_id", [
+        "learning_rate", "n_estimators", "max_depth", "subsample",
+        "colsample_bytree", "reg_lambda", "reg_alpha", "random_state",
+    ]),
+    "random_forest": ("randomforest_params", "randomforest_params_id", [
+        "n_estimators", "max_depth", "min_samples_leaf",
+        "min_samples_split", "random_state",
+    ]),
+}
+
+MODEL_COLUMNS = ["id", "name", "model_type", "accuracy", "roc_auc", "pr_auc", "parent_id"]
+
+PARAMS_MODELS = {
+    "light_gbm": LightGBMParams,
+    "xgboost": XGBoostParams,
+    "random_forest": RandomForestParams,
+}
+
+# One LEFT JOIN per params table; only the one matching model_type can hit
+LIST_MODELS_SQL = "SELECT {columns} FROM model m {joins} ORDER BY m.id".format(
+    columns=", ".join(
+        [f"m.{column}" for column in MODEL_COLUMNS]
+        + [f"{table}.{column}" for table, _, columns in PARAMS_COLUMNS.values() for column in ["id"] + columns]
+    ),
+    joins=" ".join(
+        f"LEFT JOIN {table} ON m.model_type = '{model_type}' AND {table}.id = m.{foreign_key}"
+        for model_type, (table, foreign_key, _) in PARAMS_COLUMNS.items()
+    ),
+)
+
+def is_cross_validated(model_id: int) -> bool:
+    """True if the model's stored metrics are cross-validation fold means."""
+    return db.get_connection().execute(
+        "SELECT 1 FROM model_cv WHERE model_id = ?", (model_id,)
+    ).fetchone() is not None
+
+def get_model_params(model_id: int) -> Optional[Union[LightGBMParams, XGBoostParams, RandomForestParams]]:
+    """Params a registered model was trained with, or None if the id does not exist."""
+    model_type, = db.get_connection().execute(
+        "SELECT model_type FROM model WHERE id = ?", (model_id,)
+    ).fetchone() or (None,)
+    if model_type not in PARAMS_COLUMNS:
+        return None
+
+    table, foreign_key, columns = PARAMS_COLUMNS[model_type]
+    row = db.get_connection().execute(
+        f"SELECT {', '.join(f'p.{column}' for column in columns)} FROM model m "
+        f"LEFT JOIN {table} p ON p.id = m.{foreign_key} WHERE m.id = ?",
+        (model_id,),
+    ).fetchone()
+
+    return PARAMS_MODELS[model_type](**dict(zip(columns, row)))
+
 def list_models():
-    conn = sqlite3.connect(os.path.join(BASE_DIR, "app", "db.sqlite3"))
-    cursor = conn.cursor()
-    
-    cursor.execute("""
-        SELECT id, name, path, model_type, accuracy, roc_auc, pr_auc,
-               lightgbm_params_id, xgboost_params_id, randomforest_params_id
-        FROM model
-    """)
-    rows = cursor.fetchall()
-    
+    rows = db.get_connection().execute(LIST_MODELS_SQL).fetchall()
+    cv_results = get_cv_results()
+
     models = []
     for row in rows:
-        model_id, name, path, model_type, accuracy, roc_auc, pr_auc, lgbm_id, xgb_id, rf_id = row
-        
-        params = None
-        
-        # Fetch the appropriate params based on model_type
-        if model_type == "light_gbm" and lgbm_id:
-            cursor.execute("""
-                SELECT id, learning_rate, n_estimators, num_leaves, max_depth,
-                       lambda_l1, lambda_l2, feature_fraction, random_state
-                FROM lightgbm_params WHERE id = ?
-            """, (lgbm_id,))
-            param_row = cursor.fetchone()
-            if param_row:
-                params = {
-                    "id": param_row[0],
-                    "model_type": "light_gbm",
-                    "learning_rate": param_row[1],
-                    "n_estimators": param_row[2],
-                    "num_leaves": param_row[3],
-                    "max_depth": param_row[4],
-                    "lambda_l1": param_row[5],
-                    "lambda_l2": param_row[6],
-                    "feature_fraction": param_row[7],
-                    "random_state": param_row[8]
-                }
-                
-        elif model_type == "xgboost" and xgb_id:
-            cursor.execute("""
-                SELECT id, learning_rate, n_estimators, max_depth, subsample,
-                       colsample_bytree, reg_lambda, reg_alpha, random_state
-                FROM xgboost_params WHERE id = ?
-            """, (xgb_id,))
-            param_row = cursor.fetchone()
-            if param_row:
-                params = {
-                    "id": param_row[0],
-                    "model_type": "xgboost",
-                    "learning_rate": param_row[1],
-                    "n_estimators": param_row[2],
-                    "max_depth": param_row[3],
-                    "subsample": param_row[4],
-                    "colsample_bytree": param_row[5],
-                    "reg_lambda": param_row[6],
-                    "reg_alpha": param_row[7],
-                    "random_state": param_row[8]
-                }
-                
-        elif model_type == "random_forest" and rf_id:
-            cursor.execute("""
-                SELECT id, n_estimators, max_depth, min_samples_leaf, 
-                       min_samples_split, random_state
-                FROM randomforest_params WHERE id = ?
-            """, (rf_id,))
-            param_row = cursor.fetchone()
-            if param_row:
-                params = {
-                    "id": param_row[0],
-                    "model_type": "random_forest",
-                    "n_estimators": param_row[1],
-                    "max_depth": param_row[2],
-                    "min_samples_leaf": param_row[3],
-                    "min_samples_split": param_row[4],
-                    "random_state": param_row[5]
+        model = dict(zip(MODEL_COLUMNS, row))
+        model["cv"] = cv_results.get(model["id"])
+        model["params"] = None
+
+        offset = len(MODEL_COLUMNS)
+        for model_type, (_, _, columns) in PARAMS_COLUMNS.items():
+            values = row[offset:offset + len(columns) + 1]
+            offset += len(columns) + 1
+
+            if model["model_type"] == model_type and values[0] is not None:
+                model["params"] = {
+                    "id": values[0],
+                    "model_type": model_type,
+                    **dict(zip(columns, values[1:])),
                 }
-        
-        models.append({
-            "id": model_id,
-            "name": name,
-            "model_type": model_type,
-            "accuracy": accuracy,
-            "roc_auc": roc_auc,
-            "pr_auc": pr_auc,
-            "params": params
-        })
-    
-    conn.close()
-    return models
\ No newline at end of file
+
+        models.append(model)
+
+    return models
@@ -0,0 +1,233 @@
+import os
+import json
+import math
+import time
+import random
+import itertools
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional
+from pydantic import ValidationError
+from .schemas import SweepRequest, LightGBMParams, XGBoostParams, RandomForestParams
+from . import jobs, db, governor
+
+# Candidates of a sweep are evaluated in parallel in this many processes
+SWEEP_MAX_WORKERS = int(os.environ.get("SWEEP_MAX_WORKERS", max(1, (os.cpu_count() or 2) // 2)))
+SWEEP_MAX_CANDIDATES = 256
+
+PARAMS_MODELS = {
+    "light_gbm": LightGBMParams,
+    "xgboost": XGBoostParams,
+    "random_forest": RandomForestParams,
+}
+
+# Default budget per resource when the request does not set it
+DEFAULT_RESOURCE_RANGE = {
+    "n_estimators": (50, 1000),
+    "data_fraction": (0.1, 1.0),
+}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=SWEEP_MAX_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=governor.init_training_worker,
+                initargs=(governor.training_counter(), governor.SWEEP_NICE),
+            )
+        return _executor
+
+def shutdown():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+
+def init_sweeps_table():
+    """Create the hparam_sweep table and fail sweeps left over by a previous run."""
+    with db.transaction() as cursor:
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS hparam_sweep (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                status TEXT NOT NULL,
+                model_type TEXT NOT NULL,
+                request TEXT NOT NULL,
+                rungs TEXT,
+                winners TEXT,
+                job_ids TEXT,
+                error TEXT,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL
+            )
+        """)
+        cursor.execute("""
+            UPDATE hparam_sweep SET status = ?, error = ?, finished_at = ?
+            WHERE status IN (?, ?)
+        """, (jobs.JOB_FAILED, "Interrupted by server restart", time.time(), jobs.JOB_QUEUED, jobs.JOB_RUNNING))
+
+def _update_sweep(sweep_id: int, **fields):
+    columns = ", ".join(f"{name} = ?" for name in fields)
+    with db.transaction() as cursor:
+        cursor.execute(f"UPDATE hparam_sweep SET {columns} WHERE id = ?", (*fields.values(), sweep_id))
+
+def resource_range(req: SweepRequest):
+    default_min, default_max = DEFAULT_RESOURCE_RANGE[req.resource]
+    min_resource = req.min_resource or default_min
+    max_resource = req.max_resource or default_max
+
+    if req.resource == "data_fraction":
+        max_resource = min(max_resource, 1.0)
+    if min_resource > max_resource:
+        raise ValueError("min_resource no puede ser mayor que max_resource.")
+
+    return min_resource, max_resource
+
+def build_candidates(req: SweepRequest) -> List[dict]:
+    """Expand the search space into validated parameter dicts.
+
+    Raises ValueError when the space references unknown fields, produces
+    values the params model rejects or too many combinations.
+    """
+    params_model = PARAMS_MODELS[req.model_type]
+    allowed = set(params_model.model_fields) - {"model_type"}
+
+    unknown = (set(req.space) | set(req.base_params)) - allowed
+    if unknown:
+        raise ValueError(f"Hiperparámetros no válidos para {req.model_type}: {', '.join(sorted(unknown))}")
+    if req.resource in req.space or req.resource in req.base_params:
+        raise ValueError(f"'{req.resource}' es el recurso del barrido y no puede fijarse en el espacio.")
+    if any(len(values) == 0 for values in req.space.values()):
+        raise ValueError("Cada hiperparámetro del espacio necesita al menos un valor.")
+
+    names = sorted(req.space)
+    total = math.prod(len(req.space[name]) for name in names)
+    n_candidates = min(req.n_candidates or total, total)
+    if n_candidates > SWEEP_MAX_CANDIDATES:
+        raise ValueError(f"El barrido genera {n_candidates} candidatos; el máximo es {SWEEP_MAX_CANDIDATES}.")
+
+    combinations = list(itertools.product(*(req.space[name] for name in names)))
+    if n_candidates < total:
+        combinations = random.Random(req.seed).sample(combinations, n_candidates)
+
+    candidates = []
+    for values in combinations:
+        params = {**req.base_params, **dict(zip(names, values))}
+        try:
+            validated = params_model(**params)
+        except ValidationError as e:
+            raise ValueError(f"Combinación no válida {params}: {e.errors()[0]['msg']}")
+        candidates.append(validated.model_dump(exclude_none=True))
+
+    return candidates
+
+def _with_resource(req: SweepRequest, params: dict, resource: float) -> tuple:
+    """Return (params, data_fraction) for one evaluation at the given budget."""
+    if req.resource == "n_estimators":
+        return {**params, "n_estimators": int(round(resource))}, 1.0
+    return params, resource
+
+def _run_sweep(sweep_id: int, req: SweepRequest, candidates: List[dict]):
+    # Imported here so that serving processes never load the training stack
+    from .model.kepler import evaluate_params
+
+    _update_sweep(sweep_id, status=jobs.JOB_RUNNING, started_at=time.time())
+
+    try:
+        min_resource, max_resource = resource_range(req)
+        resource = min_resource
+        survivors = candidates
+        rungs = []
+
+        while True:
+            futures = []
+            for params in survivors:
+                run_params, data_fraction = _with_resource(req, params, resource)
+                futures.append((params, _get_executor().submit(evaluate_params, req.model_type, run_params, data_fraction)))
+
+            results = []
+            for params, future in futures:
+                try:
+                    results.append({"params": params, "metrics": future.result(), "error": None})
+                except Exception as e:
+                    results.append({"params": params, "metrics": None, "error": str(e) or type(e).__name__})
+
+            results.sort(key=lambda r: r["metrics"][req.metric] if r["metrics"] else -math.inf, reverse=True)
+            rungs.append({"resource": resource, "results": results})
+            _update_sweep(sweep_id, rungs=json.dumps(rungs))
+
+            ranked = [r["params"] for r in results if r["metrics"] is not None]
+            if not ranked:
+                raise RuntimeError("Todos los candidatos fallaron.")
+            if resource >= max_resource or len(ranked) <= req.keep:
+                break
+
+            # Successive halving: solo pasa la mejor fracción 1/eta con más presupuesto
+            survivors = ranked[:max(req.keep, math.ceil(len(ranked) / req.eta))]
+            resource = min(round(resource * req.eta, 6), max_resource)
+
+        # The winners are trained on the full budget and registered as models
+        params_model = PARAMS_MODELS[req.model_type]
+        winners = [_with_resource(req, params, max_resource)[0] for params in ranked[:req.keep]]
+        job_ids = [jobs.submit_training_job(params_model(**params)) for params in winners]
+
+    except Exception as e:
+        _update_sweep(sweep_id, status=jobs.JOB_FAILED, error=str(e) or type(e).__name__, finished_at=time.time())
+        return
+
+    _update_sweep(
+        sweep_id,
+        status=jobs.JOB_SUCCEEDED,
+        winners=json.dumps(winners),
+        job_ids=json.dumps(job_ids),
+        finished_at=time.time(),
+    )
+
+def submit_sweep(req: SweepRequest) -> int:
+    """Validate the sweep, record it and start it in the background."""
+    candidates = build_candidates(req)
+    resource_range(req)
+
+    with db.transaction() as cursor:
+        cursor.execute("""
+            INSERT INTO hparam_sweep (status, model_type, request, created_at)
+            VALUES (?, ?, ?, ?)
+        """, (jobs.JOB_QUEUED, req.model_type, req.model_dump_json(), time.time()))
+        sweep_id = cursor.lastrowid
+
+    threading.Thread(target=_run_sweep, args=(sweep_id, req, candidates), daemon=True).start()
+
+    return sweep_id
+
+def get_sweep(sweep_id: int) -> Optional[dict]:
+    row = db.get_connection().execute("""
+        SELECT id, status, model_type, request, rungs, winners, job_ids, error,
+               created_at, started_at, finished_at
+        FROM hparam_sweep WHERE id = ?
+    """, (sweep_id,)).fetchone()
+
+    if row is None:
+        return None
+
+    sweep_id, status, model_type, request, rungs, winners, job_ids, error, created_at, started_at, finished_at = row
+
+    return {
+        "id": sweep_id,
+        "status": status,
+        "model_type": model_type,
+        "request": json.loads(request),
+        "rungs": json.loads(rungs) if rungs else [],
+        "winners": json.loads(winners) if winners else None,
+        "job_ids": json.loads(job_ids) if job_ids else None,
+        "error": error,
+        "created_at": created_at,
+        "started_at": started_at,
+        "finished_at": finished_at,
+    }
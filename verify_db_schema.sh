@@ -39,6 +39,31 @@ echo "------------------------------------------------------"
 sqlite3 "$DB_PATH" ".schema randomforest_params"
 echo ""
 
+echo "Training job table schema:"
+echo "------------------------------------------------------"
+sqlite3 "$DB_PATH" ".schema training_job"
+echo ""
+
+echo "Training progress table schema:"
+echo "------------------------------------------------------"
+sqlite3 "$DB_PATH" ".schema training_progress"
+echo ""
+
+echo "Model fingerprint table schema:"
+echo "------------------------------------------------------"
+sqlite3 "$DB_PATH" ".schema model_fingerprint"
+echo ""
+
+echo "Model cross-validation table schema:"
+echo "------------------------------------------------------"
+sqlite3 "$DB_PATH" ".schema model_cv"
+echo ""
+
+echo "Hyperparameter sweep table schema:"
+echo "------------------------------------------------------"
+sqlite3 "$DB_PATH" ".schema hparam_sweep"
+echo ""
+
 echo "Record counts:"
 echo "------------------------------------------------------"
 echo -n "Models: "